@@ -1,8 +1,39 @@
+import importlib
+import threading
 from flask import Flask
 from flask_cors import CORS
 # from .config import Config
 from .views.main import routes  # 从 routes/main.py 中导入蓝图
 from .api.main import api  # 从 api/main.py 中导入蓝图
+from .jobs import JobManager
+from .model import cleanup_workspaces
+from .utils.artifactCache import ArtifactCache
+
+# 启动时不导入的重依赖（见 app/utils/__init__.py），WARM_UP_IMPORTS 时在后台线程里预先导入
+WARM_UP_MODULES = (
+    "numpy",
+    "cv2",
+    "pupil_apriltags",
+    "pandas",
+    "app.utils.generateConfigFrame",
+    "app.utils.extractRawGaze",
+    "app.utils.videoSegment",
+    "app.utils.videoConfigFrame",
+)
+
+def warm_up():
+    '''Import WARM_UP_MODULES in a background thread, returns the thread.
+
+    The server answers requests meanwhile; a route that needs a module still
+    being imported simply waits for that import to finish.
+    '''
+    def run():
+        for name in WARM_UP_MODULES:
+            importlib.import_module(name)
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
 
 def create_app():
     app = Flask(__name__)
@@ -14,6 +45,21 @@ def create_app():
     app.register_blueprint(routes, url_prefix='/')
     app.register_blueprint(api, url_prefix='/api')
 
+    # 后台任务队列，长时间的 API 调用在这里运行
+    app.extensions['jobs'] = JobManager(app.config['JOB_FOLDER'], app.config['JOB_WORKERS'],
+                                         event_interval=app.config['JOB_EVENT_INTERVAL'],
+                                         max_age=app.config['JOB_MAX_AGE'], max_jobs=app.config['JOB_MAX_COUNT'])
+    # 流水线各阶段的内容寻址缓存
+    app.extensions['artifact_cache'] = ArtifactCache(app.config['ARTIFACT_CACHE_FOLDER'],
+                                                     app.config['ARTIFACT_CACHE_MAX_BYTES'])
+
+    # 删除长时间未使用的工作区
+    if app.config['WORKSPACE_MAX_AGE']:
+        cleanup_workspaces(app.config['UPLOAD_FOLDER'], app.config['OUTPUT_FOLDER'], app.config['WORKSPACE_MAX_AGE'])
+
+    if app.config['WARM_UP_IMPORTS']:
+        warm_up()
+
     return app
 
 import app.utils
@@ -1,26 +1,87 @@
-from app.utils import (
-    extractFrame,
-    gaze2npy,
-    detect_markers,
-    compute_segment_indices,
-    assign_labels,
-    generate_plot,
-    gaze_process
-)
 import os
-import numpy as np
-import cv2
 import json
-from flask import Blueprint, request, jsonify, current_app, send_from_directory
+from flask import Blueprint, Response, request, jsonify, current_app, send_from_directory, g, session
 from werkzeug.utils import secure_filename
+from app.jobs import JobCancelled, FINISHED
+from app.utils.artifactCache import record_content_hash
+from app.uploads import UploadError, create_upload, load_upload, append_chunk, take_upload
+from app.model import (
+    create_workspace,
+    resolve_workspace,
+    workspace_upload_folder,
+    workspace_output_folder,
+    workspace_output_path
+)
 import base64
 import tempfile
 from pathlib import Path
 
 
 # url prefix: /api
+# cv2, NumPy and the app.utils pipeline modules are imported inside the routes that use them,
+# so importing the blueprint (and create_app) stays fast; WARM_UP_IMPORTS preloads them
 api = Blueprint("api", __name__)
 
+# Routes that upload something, the only ones that create the session's workspace on first use
+CREATES_WORKSPACE = {
+    "api.new_upload",
+    "api.detect_segments",
+    "api.frame_config",
+    "api.extract_raw_gaze",
+    "api.upload_user_result",
+}
+
+@api.before_request
+def load_workspace():
+    """Every route works inside one workspace, see app/model.py"""
+    if request.endpoint == "api.new_workspace":
+        return
+    g.workspace = resolve_workspace(create=request.endpoint in CREATES_WORKSPACE)
+    if g.workspace is None:
+        return jsonify({"error": "Workspace not found"}), 404
+
+@api.route("/workspaces", methods=["POST"])
+def new_workspace():
+    """Create a workspace and make it the session's default one"""
+    workspace_id = create_workspace()
+    session["session_id"] = workspace_id
+    return jsonify({"workspace_id": workspace_id}), 201
+
+@api.route("/workspace", methods=["GET"])
+def get_workspace():
+    return jsonify({"workspace_id": g.workspace})
+
+def chunked_upload_folder():
+    return os.path.join(workspace_upload_folder(), "chunked")
+
+@api.errorhandler(UploadError)
+def upload_error(e):
+    return jsonify({"error": str(e)}), e.status
+
+@api.route("/uploads", methods=["POST"])
+def new_upload():
+    """Start a chunked upload: {"filename", "size"} -> {"upload_id", "offset", ...}"""
+    data = request.get_json(silent=True) or {}
+    state = create_upload(chunked_upload_folder(), secure_filename(data.get("filename", "")), data.get("size"))
+    return jsonify(state), 201
+
+@api.route("/uploads/<upload_id>", methods=["GET"])
+def get_upload(upload_id):
+    """Offset to resume from, and sha256 once the upload is complete"""
+    state = load_upload(chunked_upload_folder(), upload_id)
+    if state is None:
+        return jsonify({"error": "Upload not found"}), 404
+    return jsonify(state)
+
+@api.route("/uploads/<upload_id>", methods=["PATCH"])
+def patch_upload(upload_id):
+    """Append the raw request body at the offset given in the Upload-Offset header"""
+    offset = request.headers.get("Upload-Offset", type=int)
+    if offset is None:
+        return jsonify({"error": "Upload-Offset header required"}), 400
+    return jsonify(append_chunk(chunked_upload_folder(), upload_id, request.stream, offset,
+                                length=request.content_length))
+
 @api.route("/process_gaze", methods=["POST"])
 def process_gaze():
     data = request.json  # Expecting JSON input
@@ -30,17 +91,21 @@ def process_gaze():
 # os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 def encode_image_to_base64(img):
+    import cv2
     _, buffer = cv2.imencode('.png', img)
     return base64.b64encode(buffer).decode('utf-8')
 
 @api.route("/frame_config", methods=["POST"])
 def frame_config():
+    import cv2
+    from app.utils.generateConfigFrame import extractFrame
+
     if "image" not in request.files:
         return jsonify({"error": "No image file provided"}), 400
 
     image_file = request.files["image"]
     filename = "config_image.png"  # 统一命名
-    image_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+    image_path = os.path.join(workspace_upload_folder(), filename)
     image_file.save(image_path)
 
     image = cv2.imread(image_path)
@@ -55,12 +120,12 @@ def frame_config():
     except Exception as e:
         return jsonify({"error": "Invalid points format"}), 400
 
-    result = extractFrame(image, points)
+    result = extractFrame(image, points, cache=artifact_cache(), detect_on=current_app.config['CONFIG_FRAME_DETECT_ON'])
 
     # === Save results ===
-    output_json_path = os.path.join(current_app.config['OUTPUT_FOLDER'], "tags.json")
-    output_marker_path = os.path.join(current_app.config['OUTPUT_FOLDER'], "markers.json")
-    output_image_path = os.path.join(current_app.config['OUTPUT_FOLDER'], "config_image.png")
+    output_json_path = os.path.join(workspace_output_folder(), "tags.json")
+    output_marker_path = os.path.join(workspace_output_folder(), "markers.json")
+    output_image_path = os.path.join(workspace_output_folder(), "config_image.png")
     
     with open(output_marker_path, 'w') as f:
         json.dump(result["transformed_marker_coords"], f, indent=4)
@@ -80,21 +145,31 @@ def frame_config():
 
 @api.route("/extract_raw_gaze", methods=["POST"])
 def extract_raw_gaze():
-    """Handle Excel file upload for extracting gaze data"""
+    """Handle Excel, CSV or TSV file upload for extracting gaze data"""
+    import numpy as np
+    from app.utils.extractRawGaze import gaze2npy
+
     if "excel" not in request.files or "participant" not in request.form:
         return jsonify({"error": "Invalid request"}), 400
 
     excel_file = request.files["excel"]
     participant_name = request.form.get("participant")
     
-    filename = "gaze_data.xlsx"  # 统一命名
-    excel_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+    # 统一命名，CSV/TSV 保留扩展名以便流式读取
+    ext = os.path.splitext(excel_file.filename or "")[1].lower()
+    filename = f"gaze_data{ext}" if ext in (".csv", ".tsv") else "gaze_data.xlsx"
+    excel_path = os.path.join(workspace_upload_folder(), filename)
     excel_file.save(excel_path)
     participants = participant_name.split(', ')
-    fixation_data_list = gaze2npy(excel_path, participants)
+    fps = request.form.get("fps")
+    interval = 1000 / float(fps) if fps else current_app.config['GAZE_RESAMPLE_INTERVAL']
+    fixation_data_list = gaze2npy(excel_path, participants, interval=interval,
+                                  cache=artifact_cache(),
+                                  chunk_rows=current_app.config['GAZE_CSV_CHUNK_ROWS'],
+                                  workers=current_app.config['GAZE_EXTRACT_WORKERS'])
 
     # Save the fixation data as .npy files
-    raw_gaze_folder = os.path.join(current_app.config['OUTPUT_FOLDER'], "raw_gaze")
+    raw_gaze_folder = os.path.join(workspace_output_folder(), "raw_gaze")
     os.makedirs(raw_gaze_folder, exist_ok=True)
     for fixation_data in fixation_data_list:
         npy_file_path = os.path.join(raw_gaze_folder, f"{fixation_data['participant']}.npy")
@@ -102,49 +177,124 @@ def extract_raw_gaze():
 
     return jsonify({
         "message": f"Gaze data extracted for {participant_name}",
-        "excel_file": excel_path
+        "excel_file": excel_path,
+        "timings": {d["participant"]: round(d["seconds"], 4) for d in fixation_data_list}
     })
 
+def jobs():
+    return current_app.extensions['jobs']
+
+def artifact_cache():
+    return current_app.extensions['artifact_cache']
+
+@api.route("/cache", methods=["GET"])
+def cache_stats():
+    """Size of the artifact cache and its hit/miss counts per stage since the server started"""
+    return jsonify(artifact_cache().stats())
+
+def job_accepted(job):
+    """202 response for a queued background job, poll /api/jobs/<job_id> for its progress and result"""
+    return jsonify({
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/api/jobs/{job.id}"
+    }), 202
+
+def run_detect_segments(video_path, light, head, media, segmentation_path, step=1, workers=1, cache=None,
+                        progress=None, threads=1, prefetch=16, processes=0, chunk_frames=300):
+    from app.utils.videoSegment import detect_markers, compute_segment_indices, assign_labels, generate_plot
+
+    marker_0, marker_1, fps = detect_markers(video_path, step=step, workers=workers, progress=progress, cache=cache,
+                                             threads=threads, prefetch=prefetch, processes=processes,
+                                             chunk_frames=chunk_frames)
+    m0_merged, m1_merged, starts, ends = compute_segment_indices(marker_0, marker_1)
+    labels = assign_labels(starts, light, head, media)
+    plot_base64 = generate_plot(m0_merged, m1_merged)
+
+    # Save the segments to a JSON file with unified name
+    with open(segmentation_path, "w") as f:
+        json.dump({
+            "starts": starts,
+            "ends": ends,
+            "labels": labels,
+            "fps": fps
+        }, f, indent=2)
+
+    return {
+        "starts": starts,
+        "ends": ends,
+        "labels": labels,
+        "plot_base64": plot_base64,
+        "fps": fps
+    }
+
 @api.route("/detect_segments", methods=["POST"])
 def detect_segments():
     video_file = request.files.get("video")
+    upload_id = request.form.get("upload_id")
     light = request.form.get("light", "")
     head = request.form.get("head", "")
     media = request.form.get("media", "")
 
-    if video_file:
-        # Save the video file with unified name
-        video_path = os.path.join(current_app.config['UPLOAD_FOLDER'], "video.mp4")
+    # Save the video file with unified name, kept for later processing.
+    # Large videos come in through /api/uploads and are referenced by upload_id.
+    video_path = os.path.join(workspace_upload_folder(), "video.mp4")
+    if upload_id:
+        state = take_upload(chunked_upload_folder(), upload_id, video_path)
+        record_content_hash(video_path, state["sha256"])
+    elif video_file:
         video_file.save(video_path)
     else:
         return jsonify({"error": "No video file provided"}), 400
 
-    try:
-        marker_0, marker_1, fps = detect_markers(video_path)
-        m0_merged, m1_merged, starts, ends = compute_segment_indices(marker_0, marker_1)
-        labels = assign_labels(starts, light, head, media)
-        plot_base64 = generate_plot(m0_merged, m1_merged)
-
-        # Save the segments to a JSON file with unified name
-        segmentation_path = os.path.join(current_app.config['OUTPUT_FOLDER'], "segments.json")
-        with open(segmentation_path, "w") as f:
-            json.dump({
-                "starts": starts,
-                "ends": ends,
-                "labels": labels,
-                "fps": fps
-            }, f, indent=2)
+    segmentation_path = os.path.join(workspace_output_folder(), "segments.json")
+    job = jobs().submit("detect_segments", run_detect_segments, video_path, light, head, media, segmentation_path,
+                        workspace=g.workspace, worker_kwargs=("workers",),
+                        step=current_app.config['SEGMENT_DETECT_STEP'],
+                        workers=current_app.config['SEGMENT_DETECT_WORKERS'],
+                        chunk_frames=current_app.config['SEGMENT_DETECT_CHUNK_FRAMES'],
+                        threads=current_app.config['FRAME_PIPELINE_THREADS'],
+                        prefetch=current_app.config['FRAME_PREFETCH'],
+                        processes=current_app.config['FRAME_PIPELINE_PROCESSES'],
+                        cache=artifact_cache())
+    return job_accepted(job)
+
+def gaze_process_options():
+    """Keyword arguments for gaze_process: app config values and the artifact cache (which also keeps the homographies)"""
+    return {
+        "cache": artifact_cache(),
+        "workers": current_app.config['GAZE_PROCESS_WORKERS'],
+        "chunk_frames": current_app.config['GAZE_CHUNK_FRAMES'],
+        "tracking_interval": current_app.config['GAZE_TRACKING_INTERVAL'],
+        "tracking_max_residual": current_app.config['GAZE_TRACKING_MAX_RESIDUAL'],
+        "detect_scale": current_app.config['GAZE_DETECT_SCALE'],
+        "detect_roi_margin": current_app.config['GAZE_DETECT_ROI_MARGIN'],
+        "threads": current_app.config['FRAME_PIPELINE_THREADS'],
+        "prefetch": current_app.config['FRAME_PREFETCH'],
+        "processes": current_app.config['FRAME_PIPELINE_PROCESSES'],
+    }
 
-        return jsonify({
-            "starts": starts,
-            "ends": ends,
-            "labels": labels,
-            "plot_base64": plot_base64,
-            "fps": fps
-        })
-    finally:
-        if os.path.exists(video_path):
-            pass  # Keep video file for later processing
+def run_gaze_process(video_path, gaze_folder, segmentation_path, tags_path, output_folder, options, progress=None):
+    """Warp every participant's gaze in gaze_folder in one pass over the video.
+
+    Results go to output_folder/<participant>/, the participant being the gaze file's name. Returns the
+    participants and the segment labels that were processed, unchanged and removed.
+    """
+    from app.utils.videoConfigFrame import gaze_process_participants
+
+    gaze_paths = {}
+    if os.path.exists(gaze_folder):
+        for file in sorted(os.listdir(gaze_folder)):
+            if file.endswith(".npy"):
+                gaze_paths[os.path.splitext(file)[0]] = os.path.join(gaze_folder, file)
+    segments = None
+    if gaze_paths:
+        segments = gaze_process_participants(video_path, gaze_paths, segmentation_path, tags_path, output_folder,
+                                             progress=progress, **options)
+    return {"participants": list(gaze_paths), "segments": segments}
+
+def has_gaze_files(gaze_folder):
+    return os.path.exists(gaze_folder) and any(f.endswith(".npy") for f in os.listdir(gaze_folder))
 
 # Re-execute to restore Flask endpoint in the new kernel context
 
@@ -190,56 +340,64 @@ def submit_segments():
         })
 
     # Save with unified name
-    segmentation_path = os.path.join(current_app.config['OUTPUT_FOLDER'], "segments_25fps.json")
+    segmentation_path = os.path.join(workspace_output_folder(), "segments_25fps.json")
     with open(segmentation_path, "w") as f:
         json.dump(adjusted_segments, f, indent=2)
 
     # Process gaze data automatically
-    video_path = os.path.join(current_app.config['UPLOAD_FOLDER'], "video.mp4")
-    raw_gaze_folder = os.path.join(current_app.config['OUTPUT_FOLDER'], "raw_gaze")
-    tags_path = os.path.join(current_app.config['OUTPUT_FOLDER'], "tags.json")
-    final_output_folder = os.path.join(current_app.config['OUTPUT_FOLDER'], "final_output")
+    video_path = os.path.join(workspace_upload_folder(), "video.mp4")
+    raw_gaze_folder = os.path.join(workspace_output_folder(), "raw_gaze")
+    tags_path = os.path.join(workspace_output_folder(), "tags.json")
+    final_output_folder = os.path.join(workspace_output_folder(), "final_output")
     os.makedirs(final_output_folder, exist_ok=True)
 
-    # Process gaze data if available
-    processed = False
-    if os.path.exists(raw_gaze_folder):
-        for file in os.listdir(raw_gaze_folder):
-            if file.endswith(".npy"):
-                gaze_path = os.path.join(raw_gaze_folder, file)
-                try:
-                    gaze_process(video_path, gaze_path, segmentation_path, tags_path, final_output_folder)
-                    processed = True
-                    break
-                except Exception as e:
-                    print(f"Error processing gaze data: {e}")
-
-    return jsonify({
-        "message": "Segments saved successfully.",
-        "segment_count": len(adjusted_segments),
-        "gaze_processed": processed
-    })
-
-@api.route("/results/<filename>")
+    # Process gaze data if available, in the background
+    options = gaze_process_options()
+
+    def process_segments(workers, progress=None):
+        result = {
+            "message": "Segments saved successfully.",
+            "segment_count": len(adjusted_segments),
+            "gaze_processed": False,
+            "participants": []
+        }
+        try:
+            processed = run_gaze_process(video_path, raw_gaze_folder, segmentation_path, tags_path,
+                                         final_output_folder, dict(options, workers=workers), progress=progress)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            # The segments are saved either way, gaze can be processed again from the final results step
+            print(f"Error processing gaze data: {e}")
+            result["error"] = str(e)
+            return result
+        result["gaze_processed"] = bool(processed["participants"])
+        result.update(processed)
+        return result
+
+    return job_accepted(jobs().submit("submit_segments", process_segments, workspace=g.workspace,
+                                      worker_kwargs=("workers",), workers=options["workers"]))
+
+@api.route("/results/<path:filename>")
 def get_results(filename):
     # Try uploads folder first, then outputs folder
-    upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-    output_path = os.path.join(current_app.config['OUTPUT_FOLDER'], filename)
+    upload_path = os.path.join(workspace_upload_folder(), filename)
+    output_path = os.path.join(workspace_output_folder(), filename)
     
     if os.path.exists(upload_path):
-        return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
+        return send_from_directory(workspace_upload_folder(), filename)
     elif os.path.exists(output_path):
-        return send_from_directory(current_app.config['OUTPUT_FOLDER'], filename)
+        return send_from_directory(workspace_output_folder(), filename)
     else:
         # Try raw_gaze folder for .npy files
         if filename.endswith(".npy"):
-            raw_gaze_folder = os.path.join(current_app.config['OUTPUT_FOLDER'], "raw_gaze")
+            raw_gaze_folder = os.path.join(workspace_output_folder(), "raw_gaze")
             if os.path.exists(raw_gaze_folder):
                 for file in os.listdir(raw_gaze_folder):
                     if file.endswith(".npy"):
                         return send_from_directory(raw_gaze_folder, file)
         # Try final_output folder
-        final_output_folder = os.path.join(current_app.config['OUTPUT_FOLDER'], "final_output")
+        final_output_folder = os.path.join(workspace_output_folder(), "final_output")
         final_output_path = os.path.join(final_output_folder, filename)
         if os.path.exists(final_output_path):
             return send_from_directory(final_output_folder, filename)
@@ -249,8 +407,8 @@ def get_results(filename):
 @api.route("/results_url/<filename>")
 def get_results_url(filename):
     # Check if file exists in any of the standard locations
-    upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-    output_path = os.path.join(current_app.config['OUTPUT_FOLDER'], filename)
+    upload_path = os.path.join(workspace_upload_folder(), filename)
+    output_path = os.path.join(workspace_output_folder(), filename)
     
     if os.path.exists(upload_path) or os.path.exists(output_path):
         return jsonify({
@@ -267,22 +425,35 @@ def upload_user_result(index):
     if index < 0 or index >= len(RESULT_EXT):
         return jsonify({"error": "Invalid index"}), 400
 
-    if "file" not in request.files:
+    upload_id = request.form.get("upload_id")
+    if upload_id:
+        # Finished chunked upload from /api/uploads
+        state = load_upload(chunked_upload_folder(), upload_id)
+        if state is None:
+            return jsonify({"error": "Upload not found"}), 404
+        uploaded_name = state["filename"]
+    elif "file" in request.files:
+        file = request.files["file"]
+        uploaded_name = file.filename
+    else:
         return jsonify({"error": "No file provided"}), 400
 
-    file = request.files["file"]
     # 只检查扩展名
-    if not file.filename.lower().endswith(RESULT_EXT[index]):
+    if not uploaded_name.lower().endswith(RESULT_EXT[index]):
         return jsonify({"error": f"File must be a {RESULT_EXT[index]} file"}), 400
 
     filename = RESULT_FILENAME[index]
     # Save to appropriate folder based on file type
     if filename == "video.mp4":
-        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+        file_path = os.path.join(workspace_upload_folder(), filename)
     else:
-        file_path = os.path.join(current_app.config['OUTPUT_FOLDER'], filename)
-        
-    file.save(file_path)
+        file_path = os.path.join(workspace_output_folder(), filename)
+
+    if upload_id:
+        state = take_upload(chunked_upload_folder(), upload_id, file_path)
+        record_content_hash(file_path, state["sha256"])
+    else:
+        file.save(file_path)
 
     return jsonify({"message": f"{filename} uploaded successfully."})
 
@@ -294,39 +465,117 @@ def submit_final_results():
     else:
         output_folder = None
     if not output_folder:
-        output_folder = os.path.join(current_app.config['OUTPUT_FOLDER'], "final_output")
+        output_folder = os.path.join(workspace_output_folder(), "final_output")
+    else:
+        # Relative folders live inside the workspace, nothing may point outside of it
+        output_folder = workspace_output_path(output_folder) if isinstance(output_folder, str) else None
+        if output_folder is None:
+            return jsonify({"error": "output_folder must be a relative path inside the workspace"}), 400
     
     # Ensure output folder exists
     os.makedirs(output_folder, exist_ok=True)
 
     # Use unified file paths
-    video_path = os.path.join(current_app.config['UPLOAD_FOLDER'], "video.mp4")
-    gaze_folder = os.path.join(current_app.config['OUTPUT_FOLDER'], "raw_gaze")
-    tags_path = os.path.join(current_app.config['OUTPUT_FOLDER'], "tags.json")
-    segmentation_path = os.path.join(current_app.config['OUTPUT_FOLDER'], "segments_25fps.json")
+    video_path = os.path.join(workspace_upload_folder(), "video.mp4")
+    gaze_folder = os.path.join(workspace_output_folder(), "raw_gaze")
+    tags_path = os.path.join(workspace_output_folder(), "tags.json")
+    segmentation_path = os.path.join(workspace_output_folder(), "segments_25fps.json")
 
-    # Process gaze data
-    processed = False
-    if os.path.exists(gaze_folder):
-        for file in os.listdir(gaze_folder):
-            if file.endswith(".npy"):
-                gaze_path = os.path.join(gaze_folder, file)
-                try:
-                    gaze_process(video_path, gaze_path, segmentation_path, tags_path, output_folder)
-                    processed = True
-                    break
-                except Exception as e:
-                    print(f"Error processing gaze data: {e}")
-
-    if not processed:
+    if not has_gaze_files(gaze_folder):
         return jsonify({
             "error": "No gaze data found to process."
         }), 400
 
-    return jsonify({
-        "message": "Final results submitted successfully.",
-        "output_folder": output_folder
-    })
+    # Process gaze data in the background
+    options = gaze_process_options()
+
+    def process_final_results(workers, progress=None):
+        processed = run_gaze_process(video_path, gaze_folder, segmentation_path, tags_path, output_folder,
+                                     dict(options, workers=workers), progress=progress)
+        if not processed["participants"]:
+            raise RuntimeError("No gaze data could be processed.")
+        return {
+            "message": "Final results submitted successfully.",
+            "output_folder": output_folder,
+            **processed
+        }
+
+    return job_accepted(jobs().submit("submit_final_results", process_final_results, workspace=g.workspace,
+                                      worker_kwargs=("workers",), workers=options["workers"]))
+
+@api.route("/jobs", methods=["GET"])
+def list_jobs():
+    """Jobs of the current workspace started by this server process, without their results"""
+    return jsonify({"jobs": jobs().list(workspace=g.workspace)})
+
+def workspace_job(job_id, with_result=True):
+    """Job state like JobManager.get, None as well for jobs of another workspace"""
+    job = jobs().get(job_id, with_result=with_result)
+    if job is None or job.get("workspace") != g.workspace:
+        return None
+    return job
+
+@api.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Status, progress and (once done) result of a background job"""
+    job = workspace_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@api.route("/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id):
+    """Server-Sent Events stream of a job.
+
+    A "progress" event carries the job state every time it is published
+    (frames done/total, frames_per_second, eta_seconds, current segment), and
+    the stream ends with one "done", "failed" or "cancelled" event that also
+    carries the result. A job forgotten meanwhile (see JobManager.prune) ends
+    the stream with a "failed" event. Comments keep the connection alive
+    while nothing happens.
+    """
+    manager = jobs()
+    if workspace_job(job_id, with_result=False) is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    def stream():
+        version = -1
+        while True:
+            state, version = manager.wait(job_id, version, timeout=15)
+            if state is None and version is None:
+                state = {"id": job_id, "status": "failed", "error": "Job not found", "result": None}
+            elif state is None:
+                # 15 s without any update
+                yield ": keep-alive\n\n"
+                continue
+            finished = state["status"] in FINISHED
+            yield f"event: {state['status'] if finished else 'progress'}\ndata: {json.dumps(state)}\n\n"
+            if finished:
+                return
+
+    # no-transform keeps proxies (e.g. the dev server's) from buffering the stream for compression
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"})
+
+@api.route("/jobs/<job_id>/result", methods=["GET"])
+def get_job_result(job_id):
+    job = workspace_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] != "done":
+        return jsonify({"error": f"Job is {job['status']}", "status": job["status"], "job_error": job["error"]}), 409
+    return jsonify(job["result"])
+
+@api.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    """Cancel a queued or running job; running stages stop at their next progress report"""
+    job = workspace_job(job_id, with_result=False)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if not jobs().cancel(job_id):
+        job = jobs().get(job_id, with_result=False) or job
+        return jsonify({"error": f"Job is already {job['status']}", "status": job["status"]}), 409
+    return jsonify({"message": "Cancellation requested", "job_id": job_id}), 202
 
 @api.route("/view_json/<filename>")
 def view_json(filename):
@@ -334,10 +583,10 @@ def view_json(filename):
         return "仅支持json文件预览", 400
 
     # Try to find the file in outputs folder
-    file_path = os.path.join(current_app.config['OUTPUT_FOLDER'], filename)
+    file_path = os.path.join(workspace_output_folder(), filename)
     if not os.path.exists(file_path):
         # Try uploads folder
-        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+        file_path = os.path.join(workspace_upload_folder(), filename)
         if not os.path.exists(file_path):
             return "文件未找到", 404
             
@@ -368,7 +617,7 @@ def view_json(filename):
 @api.route("/check_existing_files", methods=["GET"])
 def check_existing_files():
     """Check which output files already exist"""
-    output_dir = current_app.config['OUTPUT_FOLDER']
+    output_dir = workspace_output_folder()
     
     existing_files = {
         "segments": os.path.exists(os.path.join(output_dir, "segments.json")),
@@ -378,7 +627,7 @@ def check_existing_files():
         "processed_gaze": len([f for f in os.listdir(os.path.join(output_dir, "processed_gaze")) if f.endswith('.npy')]) > 0 if os.path.exists(os.path.join(output_dir, "processed_gaze")) else False,
         "raw_gaze": len([f for f in os.listdir(os.path.join(output_dir, "raw_gaze")) if f.endswith('.npy')]) > 0 if os.path.exists(os.path.join(output_dir, "raw_gaze")) else False,
         "final_output": len(os.listdir(os.path.join(output_dir, "final_output"))) > 0 if os.path.exists(os.path.join(output_dir, "final_output")) else False,
-        "video": os.path.exists(os.path.join(current_app.config['UPLOAD_FOLDER'], "video.mp4")),
+        "video": os.path.exists(os.path.join(workspace_upload_folder(), "video.mp4")),
         "config_image": os.path.exists(os.path.join(output_dir, "config_image.png"))
     }
     
@@ -387,7 +636,7 @@ def check_existing_files():
 @api.route("/get_final_results", methods=["GET"])
 def get_final_results():
     """Get processed gaze results if they exist"""
-    output_dir = current_app.config['OUTPUT_FOLDER']
+    output_dir = workspace_output_folder()
     final_output_dir = os.path.join(output_dir, "final_output")
     
     if not os.path.exists(final_output_dir):
@@ -395,7 +644,14 @@ def get_final_results():
     
     # List all files in final_output directory
     try:
-        files = os.listdir(final_output_dir)
+        # Results of each participant are in final_output/<participant>/
+        files = []
+        for entry in sorted(os.listdir(final_output_dir)):
+            if os.path.isdir(os.path.join(final_output_dir, entry)):
+                files += [f"{entry}/{file}" for file in sorted(os.listdir(os.path.join(final_output_dir, entry)))
+                          if file != "manifest.json"]
+            else:
+                files.append(entry)
         result_files = []
         
         for file in files:
@@ -1,5 +1,6 @@
 '''Configuration file for the Flask application.'''
 
+import os
 import pathlib
 
 HOST = '0.0.0.0'
@@ -16,5 +17,101 @@ UPLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
 
 OUTPUT_FOLDER = ROOT_DIR / 'var' / 'outputs'
 OUTPUT_FOLDER.mkdir(parents=True, exist_ok=True)
+# Workspaces (UPLOAD_FOLDER/<id>, OUTPUT_FOLDER/<id>) not used for this many seconds are deleted;
+# 0 keeps them forever. Checked at startup and, at most every WORKSPACE_CLEANUP_INTERVAL seconds,
+# when a workspace is created
+WORKSPACE_MAX_AGE = 7 * 24 * 3600
+WORKSPACE_CLEANUP_INTERVAL = 3600
 
 # Allowed file extensions
+
+# Gaze processing
+# Worker processes for gaze_process, 1 processes all segments in the request process
+GAZE_PROCESS_WORKERS = os.cpu_count() or 1
+# Long segments are cut into chunks of this many frames before going to the pool
+GAZE_CHUNK_FRAMES = 750
+# Run full tag detection only every N frames and track the tags with optical flow
+# in between (e.g. 10); 0 detects on every frame
+GAZE_TRACKING_INTERVAL = 0
+# Forward-backward optical flow error in pixels above which tags are re-detected
+GAZE_TRACKING_MAX_RESIDUAL = 1.0
+# Detect tags on frames downscaled by this factor and refine the corners at full
+# resolution (e.g. 0.5 for 1080p, 0.25 for 4K); 1.0 detects at full resolution
+GAZE_DETECT_SCALE = 1.0
+# Search first inside boxes around the previous tag positions, grown by this many
+# tag sizes (e.g. 1.0); 0 always scans the whole frame
+GAZE_DETECT_ROI_MARGIN = 0.0
+
+# Raw gaze extraction
+# Resampling interval in ms of the raw gaze timeline, 40 ms matches 25 fps video.
+# /api/extract_raw_gaze accepts an "fps" form field to resample to the real video fps instead.
+GAZE_RESAMPLE_INTERVAL = 40
+# CSV/TSV exports are streamed in chunks of this many rows
+GAZE_CSV_CHUNK_ROWS = 200000
+# Worker processes resampling participants of an Excel export in parallel, worth it with dozens of participants
+GAZE_EXTRACT_WORKERS = 1
+
+# Segmentation
+# Sample every N-th frame in detect_markers and bisect the marker transitions
+# (e.g. 25); 1 detects on every frame. Marker states shorter than N frames can be missed.
+SEGMENT_DETECT_STEP = 1
+# Worker processes scanning contiguous frame ranges when SEGMENT_DETECT_STEP is 1
+SEGMENT_DETECT_WORKERS = os.cpu_count() or 1
+# Frames per range handed to those workers; progress and cancellation happen between ranges
+SEGMENT_DETECT_CHUNK_FRAMES = 300
+
+# Frame pipeline (see app/utils/framePipeline.py), used when a scan runs in the request's own process
+# Detection threads working on decoded frames while a reader thread decodes the next ones
+FRAME_PIPELINE_THREADS = os.cpu_count() or 1
+# Decoded frames buffered ahead of detection, bounds the memory of the pipeline
+FRAME_PREFETCH = 16
+# Detect in this many worker processes instead of threads, the decoder handing them grayscale
+# frames through a shared-memory ring of FRAME_PREFETCH slots (app/utils/frameRing.py); 0 uses threads
+FRAME_PIPELINE_PROCESSES = 0
+
+# Startup
+# create_app() doesn't import cv2, pupil_apriltags, pandas or matplotlib, the routes import them on
+# first use. True imports them in a background thread right after startup so the first request
+# doesn't wait for them; False keeps worker restarts and the dev reloader as light as possible
+WARM_UP_IMPORTS = True
+
+# Frame config (/api/frame_config)
+# Where extractFrame detects the calibration tags: "bands" on the four 800 px bands around the screen of
+# the 3520x2680 canvas, where the tags are (same tags.json as "warped" for tags outside the screen);
+# "warped" on the whole canvas, also finds tags stuck on the screen; "source" on the uploaded image, mapping
+# the tags onto the canvas. "source" is fastest and needs the least memory, but its tag centers can differ
+# by a few pixels and every homography built on them changes
+CONFIG_FRAME_DETECT_ON = "bands"
+
+# Tag detectors, built once per thread and reused for every frame (see app/utils/tagDetectors.py)
+# Keyword arguments of pupil_apriltags.Detector
+APRILTAG_DETECTOR = {
+    'families': 'tag36h11',
+    'nthreads': 1,
+    'quad_decimate': 2.0,
+    'quad_sigma': 0.0,
+    'refine_edges': 1,
+    'decode_sharpening': 0.25,
+    'debug': 0,
+}
+# Attributes set on cv2.aruco.DetectorParameters, e.g. {'cornerRefinementMethod': 1}
+ARUCO_PARAMETERS = {}
+
+# Stage outputs (parsed gaze workbooks, marker timelines, config frame tags, warped segments) keyed by input content hashes
+ARTIFACT_CACHE_FOLDER = ROOT_DIR / 'var' / 'cache' / 'artifacts'
+# Least recently used entries are evicted once the cache grows past this many bytes
+ARTIFACT_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# Background jobs (see app/jobs.py)
+# State of every job, one <job_id>.json per job
+JOB_FOLDER = ROOT_DIR / 'var' / 'jobs'
+# Jobs running at the same time, from different workspaces (the jobs of one workspace run one after
+# the other). The video stages start their own process pools; GAZE_PROCESS_WORKERS and
+# SEGMENT_DETECT_WORKERS are divided among the jobs running when a job starts
+JOB_WORKERS = 4
+# Seconds between two progress events of a job, bounds the cost of reporting from the frame loops
+JOB_EVENT_INTERVAL = 0.25
+# Finished jobs (with their results) are forgotten, in memory and in JOB_FOLDER, after this many
+# seconds, and beyond the newest JOB_MAX_COUNT of them; 0 disables either limit
+JOB_MAX_AGE = 7 * 24 * 3600
+JOB_MAX_COUNT = 200
@@ -0,0 +1,298 @@
+'''Background jobs for the long-running API calls.
+
+Jobs run on a small thread pool inside the server process (the video stages
+start their own process pools). Jobs of different workspaces run side by
+side, the jobs of one workspace one after the other in submission order, as
+they read and write the same files. Process worker counts handed to a job
+are divided among the jobs running when it starts, see JobManager.submit.
+Each job's state is persisted as
+<JOB_FOLDER>/<job_id>.json so the status endpoints can still answer for jobs
+of a previous server run. Finished jobs are dropped, from memory and from
+disk, once they are older than max_age seconds or beyond the newest
+max_jobs finished ones, see JobManager.prune.
+
+Progress reported from the frame loops is published at most every
+event_interval seconds (with frames/sec and ETA added); JobManager.wait
+blocks until the next publication, which is what the event stream uses.
+'''
+import json
+import os
+import re
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+FINISHED = ("done", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    '''Raised from a job's progress callback once the job has been cancelled.'''
+
+
+class Job:
+    def __init__(self, manager, kind, workspace=None):
+        self.manager = manager
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.workspace = workspace
+        self.status = "queued"
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.updated = self.created
+        self.cancel_requested = threading.Event()
+        self.last_saved = 0.0
+        self.last_published = 0.0
+        self.version = 0
+        # (time, frames_done) of the first report, the base of the frames/sec estimate
+        self.rate_origin = None
+
+    def to_dict(self, with_result=True):
+        data = {
+            "id": self.id,
+            "kind": self.kind,
+            "workspace": self.workspace,
+            "status": self.status,
+            "progress": dict(self.progress),
+            "error": self.error,
+            "created": self.created,
+            "updated": self.updated,
+        }
+        if with_result:
+            data["result"] = self.result
+        return data
+
+    def report(self, **fields):
+        '''Progress callback handed to the pipeline functions.
+
+        Raises JobCancelled when the job has been cancelled, which is how
+        cancellation reaches the frame loops. It is called once per frame, so
+        anything beyond storing the fields is rate-limited: listeners are
+        woken at most every manager.event_interval seconds and the state file
+        is rewritten at most every manager.save_interval seconds.
+        '''
+        if self.cancel_requested.is_set():
+            raise JobCancelled(self.id)
+        # No lock here: dict updates and copies are atomic under the GIL
+        self.progress.update(fields)
+        now = time.monotonic()
+        if now - self.last_published >= self.manager.event_interval:
+            self.update_rate(now)
+            if now - self.last_saved >= self.manager.save_interval:
+                self.manager.save(self)
+            else:
+                self.manager.publish(self)
+
+    def update_rate(self, now):
+        done, total = self.progress.get("frames_done"), self.progress.get("frames_total")
+        if done is None:
+            return
+        if self.rate_origin is None or done < self.rate_origin[1]:
+            # First report, or a new stage counting from zero again
+            self.rate_origin = (now, done)
+            return
+        t0, done0 = self.rate_origin
+        if now > t0 and done > done0:
+            rate = (done - done0) / (now - t0)
+            self.progress["frames_per_second"] = round(rate, 2)
+            if total:
+                self.progress["eta_seconds"] = round(max(total - done, 0) / rate, 1)
+
+
+class JobManager:
+    def __init__(self, folder, workers=1, save_interval=1.0, event_interval=0.25, max_age=0, max_jobs=0):
+        self.folder = str(folder)
+        os.makedirs(self.folder, exist_ok=True)
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="job")
+        self.jobs = {}
+        # workspace -> jobs waiting for the running job of that workspace, see _dispatch
+        self.waiting = {}
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.save_interval = save_interval
+        self.event_interval = event_interval
+        self.max_age = max_age
+        self.max_jobs = max_jobs
+        self.prune()
+
+    def path(self, job_id):
+        return os.path.join(self.folder, f"{job_id}.json")
+
+    def publish(self, job):
+        '''Wake up everyone waiting on this job.'''
+        with self.changed:
+            job.updated = time.time()
+            job.version += 1
+            job.last_published = time.monotonic()
+            self.changed.notify_all()
+
+    def save(self, job):
+        '''Publish and persist the job state.'''
+        self.publish(job)
+        with self.lock:
+            data = job.to_dict()
+        tmp_path = self.path(job.id) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path(job.id))
+        job.last_saved = time.monotonic()
+
+    def submit(self, kind, fn, *args, workspace=None, worker_kwargs=(), **kwargs):
+        '''Queue fn(*args, progress=job.report, **kwargs); its return value becomes the job result.
+
+        worker_kwargs names the keyword arguments that are process worker
+        counts. When the job starts they are divided by the number of running
+        jobs, this one included (at least 1 each), so jobs started side by side
+        don't oversubscribe the CPU. A job keeps its share until it ends.
+        '''
+        job = Job(self, kind, workspace)
+        with self.lock:
+            self.jobs[job.id] = job
+        self.save(job)
+        self._dispatch(job, (fn, args, kwargs, worker_kwargs))
+        return job
+
+    def _dispatch(self, job, call):
+        '''Hand the job to the thread pool, or queue it behind the running job of its workspace.'''
+        if job.workspace is not None:
+            with self.lock:
+                if job.workspace in self.waiting:
+                    self.waiting[job.workspace].append((job, call))
+                    return
+                self.waiting[job.workspace] = deque()
+        self.executor.submit(self._run, job, *call)
+
+    def _next(self, workspace):
+        '''Start the next queued job of a workspace whose job just ended.'''
+        with self.lock:
+            queue = self.waiting.get(workspace)
+            if not queue:
+                self.waiting.pop(workspace, None)
+                return
+            job, call = queue.popleft()
+        self.executor.submit(self._run, job, *call)
+
+    def _run(self, job, fn, args, kwargs, worker_kwargs=()):
+        try:
+            self._execute(job, fn, args, kwargs, worker_kwargs)
+        finally:
+            if job.workspace is not None:
+                self._next(job.workspace)
+
+    def _execute(self, job, fn, args, kwargs, worker_kwargs):
+        if job.cancel_requested.is_set():
+            job.status = "cancelled"
+            self.save(job)
+            return
+        with self.lock:
+            running = 1 + sum(other.status == "running" for other in self.jobs.values())
+            job.status = "running"
+        kwargs = dict(kwargs, **{name: max(1, kwargs[name] // running) for name in worker_kwargs})
+        self.save(job)
+        try:
+            job.result = fn(*args, progress=job.report, **kwargs)
+            job.update_rate(time.monotonic())
+            job.status = "done"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            traceback.print_exc()
+            job.status = "failed"
+            job.error = str(e)
+        self.save(job)
+        self.prune()
+
+    def prune(self):
+        '''Forget finished jobs older than max_age seconds or beyond the newest max_jobs; 0 disables either limit.
+
+        Jobs only known from their state file (previous server runs) count as
+        finished, with the file's modification time as their last update.
+        Returns the ids removed.
+        '''
+        if not self.max_age and not self.max_jobs:
+            return []
+        with self.lock:
+            running = {job_id for job_id, job in self.jobs.items() if job.status not in FINISHED}
+            finished = {job_id: job.updated for job_id, job in self.jobs.items() if job_id not in running}
+        for name in os.listdir(self.folder):
+            job_id, ext = os.path.splitext(name)
+            if ext == ".json" and JOB_ID_PATTERN.fullmatch(job_id) and job_id not in running and job_id not in finished:
+                try:
+                    finished[job_id] = os.path.getmtime(os.path.join(self.folder, name))
+                except FileNotFoundError:
+                    pass
+
+        newest_first = sorted(finished, key=finished.get, reverse=True)
+        expired = newest_first[self.max_jobs:] if self.max_jobs else []
+        if self.max_age:
+            cutoff = time.time() - self.max_age
+            expired += [job_id for job_id in newest_first[:len(newest_first) - len(expired)] if finished[job_id] < cutoff]
+        with self.changed:
+            for job_id in expired:
+                self.jobs.pop(job_id, None)
+            # Streams waiting on them end, see wait
+            self.changed.notify_all()
+        for job_id in expired:
+            try:
+                os.remove(self.path(job_id))
+            except FileNotFoundError:
+                pass
+        return expired
+
+    def get(self, job_id, with_result=True):
+        '''Job state as a dict, None for unknown ids.'''
+        if not JOB_ID_PATTERN.fullmatch(job_id):
+            return None
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is not None:
+            with self.lock:
+                return job.to_dict(with_result)
+        if not os.path.exists(self.path(job_id)):
+            return None
+        with open(self.path(job_id)) as f:
+            data = json.load(f)
+        if data["status"] not in FINISHED:
+            # Left behind by a server process that is gone
+            data["status"] = "failed"
+            data["error"] = "interrupted by a server restart"
+        if not with_result:
+            data.pop("result", None)
+        return data
+
+    def wait(self, job_id, version=-1, timeout=None):
+        '''Block until the job state is newer than version.
+
+        Returns (state, version), or (None, version) when the timeout expired
+        first. Finished states include the result. Jobs no longer in memory
+        return at once with version None: (their state from the state file,
+        always finished, None) or (None, None) once they have been pruned.
+        '''
+        with self.changed:
+            job = self.jobs.get(job_id)
+            if job is not None:
+                if not self.changed.wait_for(lambda: job.version != version or self.jobs.get(job_id) is not job,
+                                             timeout):
+                    return None, version
+                if self.jobs.get(job_id) is job:
+                    return job.to_dict(with_result=job.status in FINISHED), job.version
+        return self.get(job_id), None
+
+    def list(self, workspace=None):
+        with self.lock:
+            return [job.to_dict(with_result=False) for job in self.jobs.values()
+                    if workspace is None or job.workspace == workspace]
+
+    def cancel(self, job_id):
+        '''Request cancellation; returns False for unknown or finished jobs.'''
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None or job.status in FINISHED:
+            return False
+        job.cancel_requested.set()
+        return True
@@ -1,20 +1,119 @@
 import os
+import re
+import shutil
+import threading
+import time
 import uuid
-from flask import session, current_app
+from flask import session, current_app, request, g
 
+# Every session or pipeline works in its own workspace:
+# UPLOAD_FOLDER/<workspace_id>/ and OUTPUT_FOLDER/<workspace_id>/
+WORKSPACE_HEADER = "X-Workspace-Id"
+WORKSPACE_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+def workspace_folders(workspace_id):
+    '''(upload_folder, output_folder) of a workspace'''
+    return (os.path.join(current_app.config['UPLOAD_FOLDER'], workspace_id),
+            os.path.join(current_app.config['OUTPUT_FOLDER'], workspace_id))
+
+def workspace_exists(workspace_id):
+    return (WORKSPACE_ID_PATTERN.fullmatch(workspace_id) is not None
+            and all(os.path.isdir(folder) for folder in workspace_folders(workspace_id)))
+
+def create_workspace():
+    workspace_id = uuid.uuid4().hex
+    for folder in workspace_folders(workspace_id):
+        os.makedirs(folder, exist_ok=True)
+    maybe_cleanup_workspaces()
+    return workspace_id
+
+def touch_workspace(workspace_id):
+    '''Mark a workspace as used now, its output folder's mtime is what cleanup_workspaces looks at'''
+    os.utime(workspace_folders(workspace_id)[1])
+
+def resolve_workspace(create=False):
+    '''Workspace id of the current request, None when there is no (existing) workspace.
+
+    Taken from the X-Workspace-Id header or the "workspace" query argument,
+    otherwise the session's own workspace is used. Only with create=True (the
+    routes that upload something) is a missing session workspace created.
+    '''
+    workspace_id = request.headers.get(WORKSPACE_HEADER) or request.args.get("workspace")
+    if not workspace_id:
+        workspace_id = session.get("session_id")
+        if not (workspace_id and workspace_exists(workspace_id)):
+            if not create:
+                return None
+            workspace_id = create_workspace()
+            session["session_id"] = workspace_id
+    if not workspace_exists(workspace_id):
+        return None
+    touch_workspace(workspace_id)
+    return workspace_id
+
+def cleanup_workspaces(upload_root, output_root, max_age, now=None):
+    '''Delete the workspaces not used for max_age seconds, returns their ids'''
+    now = time.time() if now is None else now
+    workspace_ids = set()
+    for root in (upload_root, output_root):
+        if os.path.isdir(root):
+            workspace_ids.update(name for name in os.listdir(root) if WORKSPACE_ID_PATTERN.fullmatch(name))
+
+    removed = []
+    for workspace_id in sorted(workspace_ids):
+        folders = [os.path.join(str(root), workspace_id) for root in (upload_root, output_root)]
+        folders = [folder for folder in folders if os.path.isdir(folder)]
+        if max(os.path.getmtime(folder) for folder in folders) > now - max_age:
+            continue
+        for folder in folders:
+            shutil.rmtree(folder, ignore_errors=True)
+        removed.append(workspace_id)
+    return removed
+
+_cleanup_lock = threading.Lock()
+_last_cleanup = 0.0
+
+def maybe_cleanup_workspaces():
+    '''cleanup_workspaces with the app settings, at most every WORKSPACE_CLEANUP_INTERVAL seconds'''
+    global _last_cleanup
+    max_age = current_app.config['WORKSPACE_MAX_AGE']
+    if not max_age:
+        return
+    with _cleanup_lock:
+        if time.time() - _last_cleanup < current_app.config['WORKSPACE_CLEANUP_INTERVAL']:
+            return
+        _last_cleanup = time.time()
+    removed = cleanup_workspaces(current_app.config['UPLOAD_FOLDER'], current_app.config['OUTPUT_FOLDER'], max_age)
+    if removed:
+        print(f"Removed {len(removed)} workspaces unused for {max_age} s")
+
+def workspace_upload_folder():
+    '''Upload folder of the workspace resolved for this request (g.workspace)'''
+    return workspace_folders(g.workspace)[0]
+
+def workspace_output_folder():
+    '''Output folder of the workspace resolved for this request (g.workspace)'''
+    return workspace_folders(g.workspace)[1]
+
+def workspace_output_path(relative_path):
+    '''Absolute path of relative_path inside the workspace's output folder, None when it would leave it.
+
+    Absolute paths and ".." components are refused outright; the resolved path
+    (symlinks included) must still lie under the output folder.
+    '''
+    if os.path.isabs(relative_path) or ".." in re.split(r"[\\/]+", relative_path):
+        return None
+    root = os.path.realpath(workspace_output_folder())
+    path = os.path.realpath(os.path.join(root, relative_path))
+    if os.path.commonpath([root, path]) != root:
+        return None
+    return path
 
 def create_session_folder():
-    UPLOAD_FOLDER = current_app.config['UPLOAD_FOLDER']
-    session_id = f"{uuid.uuid4().hex}"
-    session['session_id'] = session_id
-    session_folder = os.path.join(UPLOAD_FOLDER, session_id)
-    os.makedirs(session_folder, exist_ok=True)
-    return session_folder
+    workspace_id = create_workspace()
+    session['session_id'] = workspace_id
+    return workspace_folders(workspace_id)[0]
 
 def get_session_folder():
-    if "session_id" not in session:
-        session["session_id"] = str(uuid.uuid4())
-    session_id = session["session_id"]
-    folder = os.path.join(current_app.config['UPLOAD_FOLDER'], session_id)
-    os.makedirs(folder, exist_ok=True)
-    return folder
\ No newline at end of file
+    return workspace_folders(resolve_workspace() or create_workspace())[0]
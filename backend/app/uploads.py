@@ -0,0 +1,135 @@
+'''Chunked, resumable uploads for large files (scene videos).
+
+A client creates an upload with the file name and size, then sends the bytes
+in any number of PATCH requests, each starting at the current offset. Bytes
+are streamed from the request straight into <folder>/<upload_id>.part, never
+held in memory, and the SHA-256 of the content is computed on the way. A
+dropped connection keeps everything received so far: the client asks for the
+offset and continues from there. Once complete, take_upload moves the file to
+where the pipeline expects it.
+'''
+import hashlib
+import json
+import os
+import re
+import threading
+import uuid
+
+UPLOAD_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+BLOCK_SIZE = 1 << 20
+
+_registry_lock = threading.Lock()
+# .part path -> lock serializing the requests of one upload
+_locks = {}
+# .part path -> (offset, sha256 object) of the running hash, rebuilt from the file after a restart
+_hashers = {}
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def upload_paths(folder, upload_id):
+    '''(.part data file, .json state file) of an upload'''
+    return os.path.join(folder, f"{upload_id}.part"), os.path.join(folder, f"{upload_id}.json")
+
+def _lock(part_path):
+    with _registry_lock:
+        return _locks.setdefault(part_path, threading.Lock())
+
+def _save_state(state_path, state):
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+def create_upload(folder, filename, size):
+    if not isinstance(size, int) or size < 0:
+        raise UploadError("size must be a non-negative integer")
+    os.makedirs(folder, exist_ok=True)
+    upload_id = uuid.uuid4().hex
+    part_path, state_path = upload_paths(folder, upload_id)
+    open(part_path, "wb").close()
+    state = {"upload_id": upload_id, "filename": filename, "size": size, "offset": 0,
+             "sha256": hashlib.sha256().hexdigest() if size == 0 else None}
+    _save_state(state_path, state)
+    return state
+
+def load_upload(folder, upload_id):
+    '''Upload state, None for unknown ids. The offset is the size of the data received so far.'''
+    if not UPLOAD_ID_PATTERN.fullmatch(upload_id):
+        return None
+    part_path, state_path = upload_paths(folder, upload_id)
+    if not os.path.exists(state_path) or not os.path.exists(part_path):
+        return None
+    with open(state_path) as f:
+        state = json.load(f)
+    state["offset"] = os.path.getsize(part_path)
+    return state
+
+def _running_hash(part_path, offset):
+    cached = _hashers.get(part_path)
+    if cached is not None and cached[0] == offset:
+        return cached[1]
+    # Server restarted (or another process took the upload), hash what is already on disk
+    hasher = hashlib.sha256()
+    with open(part_path, "rb") as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+            hasher.update(block)
+    return hasher
+
+def append_chunk(folder, upload_id, stream, offset, length=None):
+    '''Stream the bytes of a request into the upload, starting at offset.
+
+    length is the request's Content-Length when known. Whatever arrived
+    before a dropped connection is kept. Returns the new state; sha256 is set
+    once the declared size has been received.
+    '''
+    part_path, state_path = upload_paths(folder, upload_id)
+    with _lock(part_path):
+        state = load_upload(folder, upload_id)
+        if state is None:
+            raise UploadError("Upload not found", 404)
+        if state["sha256"] is not None:
+            raise UploadError("Upload already complete", 409)
+        if offset != state["offset"]:
+            raise UploadError(f"Upload is at offset {state['offset']}, not {offset}", 409)
+        if length is not None and offset + length > state["size"]:
+            raise UploadError(f"More data than the declared size of {state['size']} bytes", 413)
+
+        hasher = _running_hash(part_path, offset)
+        try:
+            with open(part_path, "ab") as f:
+                while state["offset"] < state["size"]:
+                    block = stream.read(min(BLOCK_SIZE, state["size"] - state["offset"]))
+                    if not block:
+                        break
+                    f.write(block)
+                    hasher.update(block)
+                    state["offset"] += len(block)
+        finally:
+            _hashers[part_path] = (state["offset"], hasher)
+            if state["offset"] == state["size"]:
+                state["sha256"] = hasher.hexdigest()
+                del _hashers[part_path]
+                _save_state(state_path, state)
+        if stream.read(1):
+            raise UploadError(f"More data than the declared size of {state['size']} bytes", 413)
+        return state
+
+def take_upload(folder, upload_id, target_path):
+    '''Move a complete upload to target_path and forget it, returns its final state.'''
+    part_path, state_path = upload_paths(folder, upload_id)
+    with _lock(part_path):
+        state = load_upload(folder, upload_id)
+        if state is None:
+            raise UploadError("Upload not found", 404)
+        if state["sha256"] is None:
+            raise UploadError(f"Upload incomplete, {state['offset']} of {state['size']} bytes received", 409)
+        os.replace(part_path, target_path)
+        os.remove(state_path)
+    with _registry_lock:
+        _locks.pop(part_path, None)
+    return state
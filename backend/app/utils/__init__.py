@@ -1,6 +1,43 @@
-'''Utils'''
-from app.utils.extractRawGaze import *
-from app.utils.gaze_processing import *
-from app.utils.generateConfigFrame import *
-from app.utils.videoSegment import *
-from app.utils.videoConfigFrame import *
\ No newline at end of file
+'''Utils
+
+The submodules pull in cv2, pupil_apriltags, pandas and matplotlib, so they
+are not imported with the package: the first access to a name in app.utils
+imports them all, with the same result as star-importing each one. Routes
+import what they need from the submodules themselves, see app/api/main.py.
+'''
+import importlib
+
+# Star-import order, later modules win on duplicate names
+SUBMODULES = (
+    "extractRawGaze",
+    "gaze_processing",
+    "generateConfigFrame",
+    "videoSegment",
+    "videoConfigFrame",
+    "frameSource",
+    "runLength",
+    "artifactCache",
+    "homographyStore",
+    "segmentManifest",
+)
+
+
+def load_all():
+    '''Import every submodule and expose their public names here (what the star imports used to do).'''
+    exported = []
+    for name in SUBMODULES:
+        module = importlib.import_module(f"{__name__}.{name}")
+        public = getattr(module, "__all__", None) or [k for k in vars(module) if not k.startswith("_")]
+        globals().update({k: getattr(module, k) for k in public})
+        exported += [k for k in public if k not in exported]
+    # `from app.utils import *` asks for __all__ first
+    globals()["__all__"] = exported
+
+
+def __getattr__(name):
+    if name.startswith("__") and name != "__all__":
+        raise AttributeError(name)
+    load_all()
+    if name not in globals():
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return globals()[name]
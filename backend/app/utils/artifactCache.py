@@ -0,0 +1,183 @@
+'''Content-addressed cache of pipeline stage outputs.
+
+Entries live in <folder>/<stage>/<key><ext>, where key is the SHA-256 of the
+stage inputs (file content hashes plus parameters), so a re-uploaded video or
+a re-run with unchanged inputs skips the work. Stages that keep several files
+and update them in place (the homography store) get a <folder>/<stage>/<key>/
+folder instead, see folder_entry; its files are evicted like any other. Entries are touched on every
+hit and the least recently used ones are evicted once the folder grows past
+max_bytes. Hit/miss counts are kept per stage for this process.
+'''
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+
+def file_sha256(file_path, chunk_size=1 << 20):
+    '''SHA-256 of a file's content, read in chunks.'''
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def content_hash(file_path):
+    '''SHA-256 of a file's content, memoized in a <file>.sha256 sidecar while size and mtime match.'''
+    stat = os.stat(file_path)
+    sidecar = file_path + ".sha256"
+    try:
+        with open(sidecar) as f:
+            recorded = json.load(f)
+        if recorded["size"] == stat.st_size and recorded["mtime_ns"] == stat.st_mtime_ns:
+            return recorded["sha256"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return record_content_hash(file_path, file_sha256(file_path))
+
+def record_content_hash(file_path, sha256):
+    '''Remember a hash computed elsewhere (e.g. while the file was uploaded).'''
+    stat = os.stat(file_path)
+    with open(file_path + ".sha256", "w") as f:
+        json.dump({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}, f)
+    return sha256
+
+
+class ArtifactCache:
+    def __init__(self, folder, max_bytes):
+        self.folder = str(folder)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    @staticmethod
+    def key(*parts):
+        '''Cache key of JSON-serializable parts (hashes, parameters)'''
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def path(self, stage, key, ext):
+        return os.path.join(self.folder, stage, key + ext)
+
+    def _count(self, stage, hit):
+        with self.lock:
+            counts = self.counts.setdefault(stage, {"hits": 0, "misses": 0})
+            counts["hits" if hit else "misses"] += 1
+
+    def lookup(self, stage, key, ext):
+        '''Path of a cached entry (marked as just used), None on a miss.'''
+        path = self.path(stage, key, ext)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self._count(stage, False)
+            return None
+        self._count(stage, True)
+        return path
+
+    def fetch(self, stage, key, ext, dst):
+        '''Copy a cached entry to dst (marked as just used); False on a miss.
+
+        An entry evicted after it was found, before or while being copied, is
+        a miss as well and dst is left alone.
+        '''
+        path = self.path(stage, key, ext)
+        try:
+            os.utime(path)
+            shutil.copyfile(path, dst)
+        except FileNotFoundError:
+            self._count(stage, False)
+            return False
+        self._count(stage, True)
+        return True
+
+    def folder_entry(self, stage, key):
+        '''Folder of an entry made of several files, created on a miss.
+
+        Its files are marked as just used; it counts as a hit when it already
+        had files. Eviction may remove some of them later, the owner has to
+        cope with a partial folder (HomographyStore starts over).
+        '''
+        path = self.path(stage, key, "")
+        os.makedirs(path, exist_ok=True)
+        names = [name for name in os.listdir(path) if ".tmp" not in name]
+        for name in names:
+            try:
+                os.utime(os.path.join(path, name))
+            except FileNotFoundError:
+                pass
+        self._count(stage, bool(names))
+        return path
+
+    def store(self, stage, key, ext, write):
+        '''Create an entry with write(tmp_path), then evict down to max_bytes.'''
+        path = self.path(stage, key, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Keep the extension last, some writers (cv2.imwrite) pick the format from it
+        tmp_path = f"{path[:-len(ext)]}.{threading.get_ident()}.tmp{ext}"
+        write(tmp_path)
+        os.replace(tmp_path, path)
+        self.evict()
+        return path
+
+    def evict(self):
+        with self.lock:
+            entries = []
+            for dirpath, _, filenames in os.walk(self.folder):
+                for name in filenames:
+                    if ".tmp" not in name:
+                        stat = os.stat(os.path.join(dirpath, name))
+                        entries.append((stat.st_mtime, stat.st_size, os.path.join(dirpath, name)))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                os.remove(path)
+                total -= size
+
+    def load_arrays(self, stage, key):
+        '''Arrays of a cached .npz entry as a dict, None on a miss.'''
+        # NumPy is imported on first use, create_app() builds the cache without it (see app/__init__.py)
+        import numpy as np
+        path = self.lookup(stage, key, ".npz")
+        if path is None:
+            return None
+        with np.load(path, allow_pickle=False) as npz:
+            return {name: npz[name] for name in npz.files}
+
+    def save_arrays(self, stage, key, **arrays):
+        import numpy as np
+
+        def write(tmp_path):
+            with open(tmp_path, "wb") as f:
+                np.savez(f, **arrays)
+        return self.store(stage, key, ".npz", write)
+
+    def load_json(self, stage, key):
+        path = self.lookup(stage, key, ".json")
+        if path is None:
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def save_json(self, stage, key, data):
+        def write(tmp_path):
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+        return self.store(stage, key, ".json", write)
+
+    def stats(self):
+        with self.lock:
+            entries, size = 0, 0
+            for dirpath, _, filenames in os.walk(self.folder):
+                for name in filenames:
+                    if ".tmp" not in name:
+                        entries += 1
+                        size += os.path.getsize(os.path.join(dirpath, name))
+            return {
+                "folder": self.folder,
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+                "stages": {stage: dict(counts) for stage, counts in self.counts.items()},
+            }
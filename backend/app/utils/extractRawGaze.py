@@ -2,6 +2,10 @@ import pandas as pd
 import numpy as np
 from flask import current_app
 import os
+import time
+from itertools import repeat
+from app.utils.artifactCache import content_hash
+from app.utils.workerPool import spawn_pool
 
 # 旧的 gaze2npy 函数，保留以供参考
 # def gaze2npy(file_path, participants):
@@ -47,62 +51,257 @@ import os
 
 def find_closest_indices(timestamps, interval=40):
     """
-    返回一个列表 result，满足：
+    返回一个数组 result，满足：
     result[i] 是 timestamps 中最接近 interval*i 的索引（最早出现）
+    timestamps 必须已升序排列，用 np.searchsorted 做 O(N log M) 查找
     """
-    result = []
-    max_t = timestamps.iloc[-1]
-    max_i = int(max_t // interval)
+    ts = np.asarray(timestamps)
+    max_i = int(ts[-1] // interval)
+    targets = interval * np.arange(max_i + 1)
 
-    for i in range(max_i + 1):
-        target = interval * i
-        # 计算所有时间点与目标的差的绝对值
-        diffs = np.abs(timestamps - target)
-        min_diff = diffs.min()
-        # 找到差值最小的所有索引，取最小索引（最早出现）
-        candidates = np.where(diffs == min_diff)[0]
-        chosen_idx = candidates.min()
-        result.append(chosen_idx)
+    # 右侧候选：第一个 >= target 的位置（本身就是该值最早出现的索引）
+    # targets 不超过 ts[-1]，所以 right 不会越界
+    right = np.searchsorted(ts, targets, side="left")
+    # 左侧候选：前一个位置，再退回到同值的最早索引
+    left = np.searchsorted(ts, ts[np.maximum(right - 1, 0)], side="left")
 
-    return result
+    # 距离相等时取左侧（索引更小，即最早出现）
+    use_left = np.abs(ts[left] - targets) <= np.abs(ts[right] - targets)
+    return np.where(use_left, left, right)
 
 
-def gaze2npy(file_path, participants):
-    import pandas as pd
-    import numpy as np
+# gaze2npy 只用到这些列
+GAZE_COLUMNS = [
+    "Participant name",
+    "Sensor",
+    "Recording timestamp",
+    "Fixation point X",
+    "Fixation point Y",
+]
+
+# 各列的类型：流式读取 CSV/TSV 时直接指定，Excel 解析后用 coerce_gaze_columns 转换
+GAZE_CSV_DTYPES = {
+    "Participant name": str,
+    "Sensor": str,
+    "Recording timestamp": "float64",
+    "Fixation point X": "float64",
+    "Fixation point Y": "float64",
+}
+
+
+def coerce_gaze_columns(df):
+    """
+    按 GAZE_CSV_DTYPES 统一列类型：名字列转成字符串，数值列用 pd.to_numeric 转换，
+    单元格里的文字（例如缺失值的占位符）变成 NaN，和 CSV/TSV 读出来的一致。
+    """
+    for col, dtype in GAZE_CSV_DTYPES.items():
+        if col in df:
+            df[col] = df[col].astype(str) if dtype is str else pd.to_numeric(df[col], errors="coerce")
+    return df
+
+
+def load_gaze_table(file_path, columns=GAZE_COLUMNS, cache=None):
+    """
+    读取 Excel 第一张表中的 columns 列，返回 DataFrame。
+    给定 ArtifactCache 时，第一次解析后把 GAZE_COLUMNS 按列存成 "gaze_table" 阶段的
+    .npz（键为文件内容哈希），之后同一文件（无论哪个参与者、重复请求）
+    只从缓存里按需读取 columns，不再解析 Excel；条目和其他阶段一样按 LRU 淘汰。
+    """
+    key = None
+    if cache is not None:
+        key = cache.key(content_hash(file_path), GAZE_COLUMNS)
+        cache_path = cache.lookup("gaze_table", key, ".npz")
+        if cache_path is not None:
+            print("loading gaze columns from cache")
+            with np.load(cache_path, allow_pickle=False) as npz:
+                return coerce_gaze_columns(pd.DataFrame({col: npz[col] for col in columns}))
 
     print("start loading excel")
     xls = pd.ExcelFile(file_path)
     print("start loading the first sheet")
-    df = xls.parse(xls.sheet_names[0])
+    df = coerce_gaze_columns(xls.parse(xls.sheet_names[0], usecols=GAZE_COLUMNS))
+
+    if key is not None:
+        # 字符串列存成定长 unicode 数组，读取时不需要 pickle
+        arrays = {
+            col: df[col].to_numpy(dtype=str) if GAZE_CSV_DTYPES[col] is str else df[col].to_numpy()
+            for col in GAZE_COLUMNS
+        }
+        cache.save_arrays("gaze_table", key, **arrays)
+
+    return df[columns]
+
+
+class NearestTickResampler:
+    """
+    增量版 find_closest_indices：数据可以分块、以任意顺序到达。
+    对每个 interval*i 维护左侧（<= 目标）和右侧（>= 目标）最近的候选行，
+    内存只与 tick 数有关，与行数无关。
+    时间戳相同的多行取最先到达（order 最小）的一行；距离相等时取左侧。
+    """
+
+    def __init__(self, interval=40):
+        self.interval = interval
+        self.n_ticks = 0
+        self.left_t = np.empty(0)
+        self.left_order = np.empty(0, dtype=np.int64)
+        self.left_xy = np.empty((0, 2))
+        self.right_t = np.empty(0)
+        self.right_order = np.empty(0, dtype=np.int64)
+        self.right_xy = np.empty((0, 2))
+        # 目前为止时间戳最大的一行 (t, order, xy)
+        self.last = (-np.inf, np.iinfo(np.int64).max, np.full(2, np.nan))
+        # update 累计耗时
+        self.seconds = 0.0
+
+    def _grow(self, n_ticks):
+        # 新增的 tick 都在已见过的所有行之后，左侧候选就是目前最大的那一行
+        extra = n_ticks - self.n_ticks
+        if extra <= 0:
+            return
+        t, order, xy = self.last
+        self.left_t = np.concatenate([self.left_t, np.full(extra, t)])
+        self.left_order = np.concatenate([self.left_order, np.full(extra, order)])
+        self.left_xy = np.concatenate([self.left_xy, np.tile(xy, (extra, 1))])
+        self.right_t = np.concatenate([self.right_t, np.full(extra, np.inf)])
+        self.right_order = np.concatenate([self.right_order, np.full(extra, np.iinfo(np.int64).max)])
+        self.right_xy = np.concatenate([self.right_xy, np.full((extra, 2), np.nan)])
+        self.n_ticks = n_ticks
+
+    def update(self, timestamps, points, order):
+        """timestamps (N,), points (N, 2), order (N,) 为行在文件中的全局序号"""
+        start = time.perf_counter()
+        keep = ~np.isnan(timestamps)
+        t, xy, order = timestamps[keep], points[keep], order[keep]
+        if len(t) == 0:
+            return
+        sort = np.lexsort((order, t))
+        t, xy, order = t[sort], xy[sort], order[sort]
+
+        self._grow(int(t[-1] // self.interval) + 1)
+        targets = self.interval * np.arange(self.n_ticks)
+
+        # 右侧候选：第一个 >= target 的行（同值中 order 最小）
+        idx = np.searchsorted(t, targets, side="left")
+        found = idx < len(t)
+        idx = np.minimum(idx, len(t) - 1)
+        better = found & ((t[idx] < self.right_t) | ((t[idx] == self.right_t) & (order[idx] < self.right_order)))
+        self.right_t[better] = t[idx[better]]
+        self.right_order[better] = order[idx[better]]
+        self.right_xy[better] = xy[idx[better]]
+
+        # 左侧候选：最后一个 <= target 的行，再退回到同值中 order 最小的一行
+        idx = np.searchsorted(t, targets, side="right") - 1
+        found = idx >= 0
+        idx = np.searchsorted(t, t[np.maximum(idx, 0)], side="left")
+        better = found & ((t[idx] > self.left_t) | ((t[idx] == self.left_t) & (order[idx] < self.left_order)))
+        self.left_t[better] = t[idx[better]]
+        self.left_order[better] = order[idx[better]]
+        self.left_xy[better] = xy[idx[better]]
+
+        j = np.searchsorted(t, t[-1], side="left")
+        last_t, last_order, _ = self.last
+        if t[j] > last_t or (t[j] == last_t and order[j] < last_order):
+            self.last = (t[j], order[j], xy[j])
+        self.seconds += time.perf_counter() - start
+
+    def result(self):
+        """返回每个 tick 对应的 (x, y)，形状 (n_ticks, 2)"""
+        targets = self.interval * np.arange(self.n_ticks)
+        use_left = (targets - self.left_t) <= (self.right_t - targets)
+        return np.where(use_left[:, None], self.left_xy, self.right_xy)
+
+
+def gaze2npy_streaming(file_path, participants, interval=40, chunk_rows=200000):
+    """
+    CSV/TSV 版 gaze2npy：按块读取，只读需要的列，
+    边读边按参与者和 Sensor 过滤并增量重采样，峰值内存由 chunk_rows 决定。
+    """
+    sep = "\t" if file_path.lower().endswith(".tsv") else ","
+    resamplers = {participant: NearestTickResampler(interval) for participant in participants}
+
+    print("start streaming", file_path)
+    reader = pd.read_csv(file_path, sep=sep, usecols=GAZE_COLUMNS, dtype=GAZE_CSV_DTYPES, chunksize=chunk_rows)
+    offset = 0
+    for chunk in reader:
+        order = np.arange(offset, offset + len(chunk))
+        offset += len(chunk)
+        mask = ((chunk["Sensor"] == "Eye Tracker") & chunk["Participant name"].isin(resamplers)).to_numpy()
+        rows, order = chunk[mask], order[mask]
+        for participant, group in rows.groupby("Participant name").indices.items():
+            resamplers[participant].update(
+                rows["Recording timestamp"].to_numpy()[group],
+                rows[["Fixation point X", "Fixation point Y"]].to_numpy()[group],
+                order[group]
+            )
+    print(f"streamed {offset} rows")
 
     fixation_data_list = []
     for participant in participants:
-        print("start loading ", participant)
-        df_participant = df[(df["Participant name"] == participant) & (df["Sensor"] == "Eye Tracker")]
-        df_participant = df_participant.sort_values(by="Recording timestamp")
-        df_participant = df_participant.reset_index(drop=True)
-
-        if df_participant.empty:
+        resampler = resamplers[participant]
+        if resampler.n_ticks == 0:
             print(f"Warning: No data for participant {participant}")
             continue
+        fixation_data_list.append({
+            "participant": participant,
+            "fixation_points": resampler.result(),
+            "seconds": resampler.seconds
+        })
+    return fixation_data_list
 
-        timestamps = df_participant["Recording timestamp"]
 
-        # 使用新函数，找出对应每个40*i的最接近索引
-        closest_indices = find_closest_indices(timestamps, interval=40)
-        
-        # 用这些索引取对应行（保证顺序且不重复）
-        df_participant_resampled = df_participant.loc[closest_indices]
+def resample_participant(df_participant, interval=40):
+    """单个参与者（已按 Sensor 过滤）的数据重采样，返回 (fixation_points, 耗时秒数)"""
+    start = time.perf_counter()
+    df_participant = df_participant.sort_values(by="Recording timestamp")
+    df_participant = df_participant.reset_index(drop=True)
 
-        fixation_points = df_participant_resampled[["Fixation point X", "Fixation point Y"]].to_numpy()
+    timestamps = df_participant["Recording timestamp"]
 
-        fixation_data = {
-            "participant": participant,
-            "fixation_points": fixation_points
-        }
+    # 找出对应每个 interval*i 的最接近索引
+    closest_indices = find_closest_indices(timestamps, interval=interval)
 
-        fixation_data_list.append(fixation_data)
+    # 用这些索引取对应行（保证顺序且不重复）
+    df_participant_resampled = df_participant.loc[closest_indices]
 
-    return fixation_data_list
+    fixation_points = df_participant_resampled[["Fixation point X", "Fixation point Y"]].to_numpy()
+    return fixation_points, time.perf_counter() - start
 
+
+def gaze2npy(file_path, participants, interval=40, cache=None, chunk_rows=200000, workers=1):
+    """
+    一次遍历提取多个参与者：Sensor 过滤只做一次，再按 Participant name 分组，
+    每组独立重采样；workers > 1 时各组交给进程池。
+    返回的每项带 "seconds"，即该参与者重采样耗时。
+    """
+    import pandas as pd
+    import numpy as np
+
+    if file_path.lower().endswith((".csv", ".tsv")):
+        return gaze2npy_streaming(file_path, participants, interval=interval, chunk_rows=chunk_rows)
+
+    df = load_gaze_table(file_path, cache=cache)
+    df = df[(df["Sensor"] == "Eye Tracker") & df["Participant name"].isin(participants)]
+    groups = dict(tuple(df.groupby("Participant name", sort=False)))
+
+    found = [participant for participant in participants if participant in groups]
+    for participant in participants:
+        if participant not in groups:
+            print(f"Warning: No data for participant {participant}")
+
+    if workers > 1 and len(found) > 1:
+        with spawn_pool(min(workers, len(found))) as pool:
+            results = list(pool.map(resample_participant, [groups[p] for p in found], repeat(interval, len(found))))
+    else:
+        results = [resample_participant(groups[p], interval) for p in found]
+
+    fixation_data_list = []
+    for participant, (fixation_points, seconds) in zip(found, results):
+        print(f"{participant}: {len(groups[participant])} rows -> {len(fixation_points)} samples in {seconds:.3f}s")
+        fixation_data_list.append({
+            "participant": participant,
+            "fixation_points": fixation_points,
+            "seconds": seconds
+        })
+
+    return fixation_data_list
@@ -0,0 +1,85 @@
+'''Decode / detect / collect pipeline over a stream of video frames.
+
+A reader thread pulls (frame_idx, frame) items from a frame iterator (e.g.
+FrameSource.frames) into a bounded prefetch queue, so the decoder keeps
+working while frames are being detected. A pool of detection threads runs
+work(frame_idx, frame) on them; cv2 and pupil_apriltags release the GIL, so
+the threads really run in parallel. Results are collected and yielded in
+frame order.
+
+Memory stays bounded: at most `prefetch` decoded frames wait in the queue
+and at most 2 * `threads` frames are being detected or wait to be collected.
+When the consumer is slower, the reader blocks (backpressure) instead of
+decoding further ahead.
+
+work must be safe to call from several threads, e.g. by taking its
+detectors from app/utils/tagDetectors.py, unless threads is 1: a single
+detection thread handles frames one at a time, in order, which suits
+stateful work such as TagTracker.
+'''
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Full, Queue
+
+from app.utils.workerPool import cancelling
+
+_END = object()
+
+
+class _ReadError:
+    def __init__(self, error):
+        self.error = error
+
+
+def _read_ahead(frames, queue, stop):
+    '''Reader thread: fill queue from frames until they run out or stop is set.'''
+    def put(item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    try:
+        for item in frames:
+            if not put(item):
+                return
+        put(_END)
+    except BaseException as e:
+        put(_ReadError(e))
+    finally:
+        if hasattr(frames, "close"):
+            frames.close()
+
+
+def pipelined(frames, work, threads=1, prefetch=16):
+    '''Yield (frame_idx, work(frame_idx, frame)) for every item of frames, in order.'''
+    stop = threading.Event()
+    queue = Queue(maxsize=max(prefetch, 1))
+    reader = threading.Thread(target=_read_ahead, args=(frames, queue, stop), name="frame-reader", daemon=True)
+    reader.start()
+    in_flight = deque()
+    try:
+        # Consumer gone or work failed: don't detect frames nobody will collect
+        with cancelling(ThreadPoolExecutor(threads, thread_name_prefix="frame-detect")) as pool:
+            while True:
+                item = queue.get()
+                if item is _END:
+                    break
+                if isinstance(item, _ReadError):
+                    raise item.error
+                frame_idx, frame = item
+                in_flight.append((frame_idx, pool.submit(work, frame_idx, frame)))
+                if len(in_flight) >= 2 * threads:
+                    frame_idx, future = in_flight.popleft()
+                    yield frame_idx, future.result()
+            while in_flight:
+                frame_idx, future = in_flight.popleft()
+                yield frame_idx, future.result()
+    finally:
+        # The frame iterator usually reads from a capture the caller is about to release
+        stop.set()
+        reader.join()
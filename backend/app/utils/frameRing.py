@@ -0,0 +1,108 @@
+'''Frame pipeline with detection in worker processes, fed through shared memory.
+
+Same contract as framePipeline.pipelined, for detection that holds the GIL
+for too long to scale with threads (the Python side of tag matching and
+quad selection). Instead of pickling every decoded frame to the workers,
+the decoder converts each frame to grayscale straight into a slot of a ring
+buffer in multiprocessing.shared_memory, sized to the video resolution on
+the first frame. Workers attach the ring once, in their initializer, and
+run work(frame_idx, gray) on a NumPy view of the slot, so only slot indices
+and the (small) detection results cross process boundaries.
+
+A slot is reused only after its result has been collected, so the number of
+slots bounds both memory and how far decoding runs ahead.
+'''
+from collections import deque
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from app.utils.workerPool import cancelling, make_spawn_pool
+
+
+class FrameRing:
+    '''`slots` grayscale frames of `shape` in one shared memory block.'''
+
+    def __init__(self, shape, slots, name=None):
+        size = slots * shape[0] * shape[1]
+        # Workers attach by name; the creating process alone unlinks the block
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.frames = np.ndarray((slots, shape[0], shape[1]), dtype=np.uint8, buffer=self.shm.buf)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def write(self, slot, frame):
+        '''Store a BGR frame as grayscale in slot, without an intermediate copy.'''
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.frames[slot])
+
+    def close(self):
+        # Views on the buffer must go before the block can be closed
+        self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# Per-process state of the ring workers, set once by _init_ring_worker
+_worker_ring = {}
+
+
+def _init_ring_worker(name, shape, slots, initializer, initargs):
+    _worker_ring["ring"] = FrameRing(shape, slots, name=name)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _ring_task(work, slot, frame_idx):
+    return work(frame_idx, _worker_ring["ring"].frames[slot])
+
+
+def shared_frame_pipeline(frames, work, processes, slots=16, initializer=None, initargs=()):
+    '''Yield (frame_idx, work(frame_idx, gray)) for every (frame_idx, frame) of frames, in order.
+
+    work runs in one of `processes` worker processes and must be a module
+    level function; initializer(*initargs) runs once per worker. Frames that
+    are None are yielded with a None result without going to the workers.
+    '''
+    slots = max(slots, 2 * processes)
+    frames = iter(frames)
+    in_flight = deque()
+    ring = None
+    try:
+        for frame_idx, frame in frames:
+            if frame is not None:
+                break
+            yield frame_idx, None
+        else:
+            return
+
+        ring = FrameRing(frame.shape[:2], slots)
+        pool = make_spawn_pool(processes, _init_ring_worker, (ring.name, frame.shape[:2], slots, initializer, initargs))
+        # Consumer gone or work failed: don't detect frames nobody will collect,
+        # but let the running tasks finish before their ring is closed
+        with cancelling(pool, wait=True):
+            free = deque(range(slots))
+            pending = (frame_idx, frame)
+            while pending is not None or in_flight:
+                # Decode into free slots while the workers detect
+                while pending is not None and free:
+                    frame_idx, frame = pending
+                    if frame is None:
+                        in_flight.append((frame_idx, None, None))
+                    else:
+                        slot = free.popleft()
+                        ring.write(slot, frame)
+                        in_flight.append((frame_idx, slot, pool.submit(_ring_task, work, slot, frame_idx)))
+                    pending = next(frames, None)
+                frame_idx, slot, future = in_flight.popleft()
+                result = None if future is None else future.result()
+                if slot is not None:
+                    free.append(slot)
+                yield frame_idx, result
+    finally:
+        if ring is not None:
+            ring.close()
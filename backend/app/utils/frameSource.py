@@ -0,0 +1,84 @@
+import cv2
+
+
+def merge_ranges(ranges):
+    '''Sort [start, end) frame ranges and merge the ones that overlap or touch.'''
+    merged = []
+    for start, end in sorted((int(s), int(e)) for s, e in ranges):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def split_ranges(ranges, chunk_frames):
+    '''Merge ranges and cut them into consecutive chunks of at most chunk_frames frames.'''
+    chunks = []
+    for start, end in merge_ranges(ranges):
+        for chunk_start in range(start, end, chunk_frames):
+            chunks.append((chunk_start, min(chunk_start + chunk_frames, end)))
+    return chunks
+
+
+class FrameSource:
+    '''Stream frames of a video over a set of frame ranges.
+
+    The ranges are sorted and merged, the capture seeks once at the start of
+    every contiguous run and then reads forward. Short gaps between runs are
+    grabbed through instead of seeking, since a seek on H.264 re-decodes from
+    the previous keyframe anyway.
+    '''
+
+    def __init__(self, video_path, max_skip=50):
+        self.cap = cv2.VideoCapture(video_path)
+        self.max_skip = max_skip
+        self.pos = 0
+
+    @property
+    def fps(self):
+        return self.cap.get(cv2.CAP_PROP_FPS)
+
+    @property
+    def frame_count(self):
+        return int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    def seek(self, frame_idx):
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+        self.pos = frame_idx
+
+    def frames(self, ranges):
+        '''Yield (frame_idx, frame) for every frame index covered by ranges.
+
+        Frames that cannot be read (negative indices, past the end of the
+        video) are yielded as None. Frames left out of the ranges are not
+        yielded; short gaps are grabbed through without decoding.
+        '''
+        for start, end in merge_ranges(ranges):
+            for frame_idx in range(start, min(end, 0)):
+                yield frame_idx, None
+            start = max(start, 0)
+            if start >= end:
+                continue
+
+            if start < self.pos or start - self.pos > self.max_skip:
+                self.seek(start)
+            while self.pos < start:
+                self.cap.grab()
+                self.pos += 1
+
+            for frame_idx in range(start, end):
+                ret, frame = self.cap.read()
+                self.pos += 1
+                yield frame_idx, frame if ret else None
+
+    def release(self):
+        self.cap.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
@@ -1,14 +1,182 @@
 import os
 import cv2
 import json
+import hashlib
 import numpy as np
-from pupil_apriltags import Detector
+from app import config
+from app.utils.tagDetectors import get_apriltag_detector, get_aruco_detector
 # from flask import current_app
 
 # output_json_dir = current_app.config['OUTPUT_FOLDER']
 # output_image_dir = current_app.config['OUTPUT_FOLDER']
 
-def extractFrame(image, points, save=True):
+def enhance(image):
+    # Convert to grayscale and enhance
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gray = cv2.equalizeHist(gray)
+    return cv2.GaussianBlur(gray, (5, 5), 0)
+
+def detect_tags(warped_image):
+    '''在 warp 后的整张画布上检测，返回 (apriltags, arucos)，每个标签为 (id, 角点 int32, 中心)'''
+    gray = enhance(warped_image)
+    apriltags = []
+    for tag in get_apriltag_detector().detect(gray, estimate_tag_pose=False):
+        apriltags.append((tag.tag_id, np.int32(tag.corners), (int(tag.center[0]), int(tag.center[1]))))
+
+    arucos = []
+    corners_list, ids, _ = get_aruco_detector(cv2.aruco.DICT_ARUCO_ORIGINAL).detectMarkers(gray)
+    if ids is not None:
+        for idx, corner in zip(ids.flatten(), corners_list):
+            c = corner[0]
+            center = np.mean(c, axis=0).astype(int)
+            arucos.append((idx, np.int32(c), (int(center[0]), int(center[1]))))
+    return apriltags, arucos
+
+# detect_band_tags 的裁剪区域：向屏幕内多取 BAND_CONTEXT 像素作为检测器需要的邻域，
+# 左右两条带再上下多取 BAND_OVERLAP 像素，跨在上下带与左右带分界处的标签能完整地落在左右带里
+BAND_CONTEXT = 64
+BAND_OVERLAP = 384
+
+def _align_down(value, step):
+    return value // step * step
+
+def _align_up(value, step):
+    return -(-value // step) * step
+
+def band_regions(canvas_size, boundary, footprint=None, context=BAND_CONTEXT, overlap=BAND_OVERLAP):
+    '''画布四周 boundary 宽的四条带子对应的检测区域，返回 [(crop, safe)]。
+
+    crop 是 (x0, y0, x1, y1)；safe 是标签四个角都必须落在里面的范围，即 crop 在切开的边上
+    往里收 context，画布边缘不限制。crop 的左上角按 AprilTag 阈值分块（4 * quad_decimate 像素）
+    对齐，分块和整张画布一致。给定 footprint（原图 warp 到画布后的外接框）时，crop 再裁到
+    footprint 外扩 context 的范围，外面全是 warp 填充的黑色，检测不到任何东西。
+    '''
+    width, height = canvas_size
+    inf = float("inf")
+    step = max(int(4 * config.APRILTAG_DETECTOR.get("quad_decimate", 1.0)), 1)
+    top, bottom = max(boundary - overlap, 0), min(height - boundary + overlap, height)
+    bands = [
+        ((0, 0, width, boundary + context), (-inf, -inf, inf, boundary)),
+        ((0, height - boundary - context, width, height), (-inf, height - boundary, inf, inf)),
+        ((0, top, boundary + context, bottom), (-inf, top + context if top else -inf, boundary, bottom - context if bottom < height else inf)),
+        ((width - boundary - context, top, width, bottom), (width - boundary, top + context if top else -inf, inf, bottom - context if bottom < height else inf)),
+    ]
+    regions = []
+    for (x0, y0, x1, y1), safe in bands:
+        if footprint is not None:
+            fx0, fy0, fx1, fy1 = footprint
+            x0, y0, x1, y1 = max(x0, fx0 - context), max(y0, fy0 - context), min(x1, fx1 + context), min(y1, fy1 + context)
+        x0, y0 = max(_align_down(x0, step), 0), max(_align_down(y0, step), 0)
+        x1, y1 = min(_align_up(x1, step), width), min(_align_up(y1, step), height)
+        if x0 < x1 and y0 < y1:
+            regions.append(((x0, y0, x1, y1), safe))
+    return regions
+
+def _band_aruco_detector(canvas_size, crop_size):
+    '''ArUco 检测器，周长上下限（比例 * 图像长边，取整到像素）和在整张画布上检测时相同'''
+    parameters = cv2.aruco.DetectorParameters()
+    for name, value in config.ARUCO_PARAMETERS.items():
+        setattr(parameters, name, value)
+    full, crop = max(canvas_size), max(crop_size)
+    # 取整后的像素数 + 0.5 再换算回比例，OpenCV 截断时得到同一个整数
+    parameters.minMarkerPerimeterRate = (int(parameters.minMarkerPerimeterRate * full) + 0.5) / crop
+    parameters.maxMarkerPerimeterRate = (int(parameters.maxMarkerPerimeterRate * full) + 0.5) / crop
+    return cv2.aruco.ArucoDetector(cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_ARUCO_ORIGINAL), parameters)
+
+def detect_band_tags(warped_image, boundary, footprint=None):
+    '''和 detect_tags 结果相同，但只在四条 boundary 带子（标签所在的位置）上检测。
+
+    equalizeHist 用整张画布的直方图，GaussianBlur 和两种检测只处理 band_regions 的裁剪区域，
+    坐标再加上裁剪的偏移。只保留完整落在 safe 范围里的标签，离切口至少 BAND_CONTEXT 像素，
+    检测结果和整张画布上的相同；两个区域都完整看到的标签（角上的）只保留一次。
+    输出顺序也和 detect_tags 一致：AprilTag 按 id，ArUco 按周长从大到小。
+    伸进屏幕矩形的标签不会被检测到，这种布置用 detect_tags。
+    '''
+    height, width = warped_image.shape[:2]
+    gray = cv2.equalizeHist(cv2.cvtColor(warped_image, cv2.COLOR_BGR2GRAY))
+
+    apriltags = {}
+    arucos = {}
+    for (x0, y0, x1, y1), (sx0, sy0, sx1, sy1) in band_regions((width, height), boundary, footprint):
+        # 5x5 的模糊核需要 2 像素邻域，多取一圈再切掉，结果和整张图模糊完全相同
+        bx0, by0, bx1, by1 = max(x0 - 2, 0), max(y0 - 2, 0), min(x1 + 2, width), min(y1 + 2, height)
+        blurred = cv2.GaussianBlur(gray[by0:by1, bx0:bx1], (5, 5), 0)
+        crop = np.ascontiguousarray(blurred[y0 - by0:y1 - by0, x0 - bx0:x1 - bx0])
+        offset = np.array([x0, y0])
+
+        def safe(corners):
+            return bool(np.all((corners >= (sx0, sy0)) & (corners <= (sx1, sy1))))
+
+        for tag in get_apriltag_detector().detect(crop, estimate_tag_pose=False):
+            corners = tag.corners + offset
+            if safe(corners):
+                center = (int(tag.center[0] + x0), int(tag.center[1] + y0))
+                apriltags[(tag.tag_id, center)] = (tag.tag_id, np.int32(corners), center)
+
+        corners_list, ids, _ = _band_aruco_detector((width, height), (x1 - x0, y1 - y0)).detectMarkers(crop)
+        if ids is not None:
+            for idx, corner in zip(ids.flatten(), corners_list):
+                c = corner[0] + offset.astype(np.float32)
+                if safe(c):
+                    center = np.mean(c, axis=0).astype(int)
+                    center = (int(center[0]), int(center[1]))
+                    arucos[(idx, center)] = (idx, np.int32(c), center, cv2.arcLength(c, True))
+
+    apriltags = sorted(apriltags.values(), key=lambda tag: tag[0])
+    arucos = sorted(arucos.values(), key=lambda tag: -tag[3])
+    return apriltags, [tag[:3] for tag in arucos]
+
+def detect_source_tags(image, matrix, output_size):
+    '''和 detect_tags 一样，但在原图上检测，再用 matrix 把角点和中心映射到画布坐标。
+
+    原图通常比 3520x2680 的画布小得多，检测更快、占用内存更少。只保留四个角都落在画布内的标签，
+    也就是在画布上检测时能看到的那些。
+    '''
+    gray = enhance(image)
+    width, height = output_size
+
+    def to_canvas(points):
+        return cv2.perspectiveTransform(np.asarray(points, dtype=np.float64).reshape(-1, 1, 2), matrix).reshape(-1, 2)
+
+    def inside(corners):
+        return bool(np.all((corners >= 0) & (corners < (width, height))))
+
+    apriltags = []
+    for tag in get_apriltag_detector().detect(gray, estimate_tag_pose=False):
+        corners = to_canvas(tag.corners)
+        if inside(corners):
+            # 投影变换保持对角线交点，映射后的中心就是画布上四边形的中心
+            center = to_canvas(tag.center)[0]
+            apriltags.append((tag.tag_id, np.int32(corners), (int(center[0]), int(center[1]))))
+
+    arucos = []
+    corners_list, ids, _ = get_aruco_detector(cv2.aruco.DICT_ARUCO_ORIGINAL).detectMarkers(gray)
+    if ids is not None:
+        for idx, corner in zip(ids.flatten(), corners_list):
+            corners = to_canvas(corner[0])
+            if inside(corners):
+                center = np.mean(corners.astype(np.float32), axis=0).astype(int)
+                arucos.append((idx, np.int32(corners), (int(center[0]), int(center[1]))))
+    return apriltags, arucos
+
+def extractFrame(image, points, save=True, cache=None, detect_on="bands"):
+    # 给定 ArtifactCache 时，按图像内容、标注点和检测参数缓存结果
+    # detect_on="bands" 只在画布四周的 boundary 带子上检测，见 detect_band_tags；
+    # "warped" 在整张画布上检测；"source" 在原图上检测标签再映射到画布，见 detect_source_tags
+    if cache is not None:
+        key = cache.key(hashlib.sha256(np.ascontiguousarray(image)).hexdigest(), image.shape, points[:8],
+                        config.APRILTAG_DETECTOR, config.ARUCO_PARAMETERS, detect_on)
+        cached = cache.load_arrays("config_frame", key)
+        if cached is not None:
+            result = json.loads(str(cached["result"]))
+            result["warped_image"] = cv2.imdecode(cached["warped_png"], cv2.IMREAD_COLOR)
+            return result
+        result = extractFrame(image, points, save, detect_on=detect_on)
+        cache.save_arrays("config_frame", key,
+                          warped_png=cv2.imencode(".png", result["warped_image"])[1],
+                          result=np.array(json.dumps({k: v for k, v in result.items() if k != "warped_image"})))
+        return result
+
     display_width = 500
     scale = image.shape[1] / display_width
 
@@ -36,11 +204,6 @@ def extractFrame(image, points, save=True):
         transformed /= transformed[:, [2]]
         transformed_marker_coords = [{"x": float(p[0]), "y": float(p[1])} for p in transformed]
 
-    # Convert to grayscale and enhance
-    gray = cv2.cvtColor(warped_image, cv2.COLOR_BGR2GRAY)
-    gray = cv2.equalizeHist(gray)
-    gray = cv2.GaussianBlur(gray, (5, 5), 0)
-
     tag_data = {
         "boundary": boundary,
         "screen_width": screen_width,
@@ -49,50 +212,44 @@ def extractFrame(image, points, save=True):
         "arucos": []
     }
 
+    if detect_on == "source":
+        apriltags, arucos = detect_source_tags(image, matrix, (output_width, output_height))
+    elif detect_on == "bands":
+        # 原图四个角 warp 到画布后的外接框，框外只有填充的黑色；
+        # 有角落到相机后面（齐次坐标 w <= 0）时外接框没有意义，整条带子都检测
+        h, w = image.shape[:2]
+        corners = np.float64([[0, 0, 1], [w, 0, 1], [w, h, 1], [0, h, 1]]) @ matrix.T
+        footprint = None
+        if np.all(corners[:, 2] > 0):
+            corners = corners[:, :2] / corners[:, 2:]
+            x0, y0 = np.floor(corners.min(axis=0)).astype(int)
+            x1, y1 = np.ceil(corners.max(axis=0)).astype(int) + 1
+            footprint = (x0, y0, x1, y1)
+        apriltags, arucos = detect_band_tags(warped_image, boundary, footprint)
+    else:
+        apriltags, arucos = detect_tags(warped_image)
+
     # === AprilTag detection ===
-    detector = Detector(
-        families='tag36h11',
-        nthreads=1,
-        quad_decimate=2.0,
-        quad_sigma=0.0,
-        refine_edges=1,
-        decode_sharpening=0.25,
-        debug=0
-    )
-    apriltags = detector.detect(gray, estimate_tag_pose=False)
-    for tag in apriltags:
-        tag_id = tag.tag_id
-        center = (int(tag.center[0]), int(tag.center[1]))
+    for tag_id, corners, center in apriltags:
         tag_data["apriltags"].append({
             "id": int(tag_id),
             "center": {"x": center[0], "y": center[1]}
         })
-        corners = np.int32(tag.corners)
         cv2.polylines(warped_image, [corners], isClosed=True, color=(0, 255, 0), thickness=2)
         cv2.circle(warped_image, center, 5, (0, 0, 255), -1)
         cv2.putText(warped_image, f"April:{tag_id}", (center[0]-10, center[1]-10),
                     cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 1)
 
     # === ArUco detection ===
-    aruco_dict = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_ARUCO_ORIGINAL)
-    aruco_params = cv2.aruco.DetectorParameters()
-    aruco_detector = cv2.aruco.ArucoDetector(aruco_dict, aruco_params)
-    corners_list, ids, _ = aruco_detector.detectMarkers(gray)
-
-    if ids is not None:
-        for idx, corner in zip(ids.flatten(), corners_list):
-            c = corner[0]
-            center = np.mean(c, axis=0).astype(int)
-            tag_data["arucos"].append({
-                "id": int(idx),
-                "center": {"x": int(center[0]), "y": int(center[1])}
-            })
-            cv2.polylines(warped_image, [np.int32(c)], isClosed=True, color=(255, 0, 255), thickness=2)
-            cv2.circle(warped_image, tuple(center), 5, (0, 255, 255), -1)
-            cv2.putText(warped_image, f"Aruco:{idx}", (center[0]-10, center[1]-10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
-
-
+    for idx, corners, center in arucos:
+        tag_data["arucos"].append({
+            "id": int(idx),
+            "center": {"x": center[0], "y": center[1]}
+        })
+        cv2.polylines(warped_image, [corners], isClosed=True, color=(255, 0, 255), thickness=2)
+        cv2.circle(warped_image, center, 5, (0, 255, 255), -1)
+        cv2.putText(warped_image, f"Aruco:{idx}", (center[0]-10, center[1]-10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
 
     return {
         "warped_image": warped_image,
@@ -0,0 +1,110 @@
+'''Per-frame screen homographies of one video, persisted as memory-mapped arrays.
+
+Tag detection depends on the video, the tag layout and the tracker options,
+not on whose gaze is warped. The homography of every processed frame is
+kept in
+
+    <folder>/homographies.npy   float64 (n_frames, 3, 3)
+    <folder>/status.npy         uint8 (n_frames,), NOT_COMPUTED / VALID / NOT_FOUND
+    <folder>/meta.json          the inputs the arrays were computed for
+
+so warping another participant, or a segment over frames already seen, is a
+batched NumPy operation instead of another pass over the video. The folder is
+an ArtifactCache folder entry keyed by those inputs, shared by every
+workspace and evicted with the rest of the cache. Without a folder the store
+lives in memory only.
+'''
+import json
+import os
+
+import numpy as np
+
+from app.utils.runLength import run_lengths
+
+NOT_COMPUTED, VALID, NOT_FOUND = 0, 1, 2
+
+
+class HomographyStore:
+    def __init__(self, folder=None, inputs=None):
+        self.folder = folder
+        self.matrices = np.zeros((0, 3, 3))
+        self.status = np.zeros(0, dtype=np.uint8)
+        if folder is None:
+            return
+        os.makedirs(folder, exist_ok=True)
+        meta_path = os.path.join(folder, "meta.json")
+        # Round-trip through JSON so tuples and lists compare equal
+        inputs = json.loads(json.dumps(inputs))
+        meta = None
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        if meta == inputs and all(os.path.exists(self._path(name)) for name in ("homographies", "status")):
+            self.matrices = np.load(self._path("homographies"), mmap_mode="r+")
+            self.status = np.load(self._path("status"), mmap_mode="r+")
+        else:
+            # Different video, tags or options: start over
+            for name in ("homographies", "status"):
+                if os.path.exists(self._path(name)):
+                    os.remove(self._path(name))
+            with open(meta_path, "w") as f:
+                json.dump(inputs, f)
+
+    def _path(self, name):
+        return os.path.join(self.folder, f"{name}.npy")
+
+    def __len__(self):
+        return len(self.status)
+
+    def ensure(self, n_frames):
+        '''Grow the arrays to hold at least n_frames frames.'''
+        if n_frames <= len(self):
+            return
+        matrices = np.zeros((n_frames, 3, 3))
+        status = np.zeros(n_frames, dtype=np.uint8)
+        matrices[:len(self)] = self.matrices
+        status[:len(self)] = self.status
+        if self.folder is None:
+            self.matrices, self.status = matrices, status
+            return
+        # Drop the old maps before their files are rewritten
+        self.matrices = self.status = None
+        np.save(self._path("homographies"), matrices)
+        np.save(self._path("status"), status)
+        self.matrices = np.load(self._path("homographies"), mmap_mode="r+")
+        self.status = np.load(self._path("status"), mmap_mode="r+")
+
+    def missing(self, ranges):
+        '''Sub-ranges of the [start, end) ranges (merged, non-negative) whose frames are not computed yet.'''
+        todo = np.zeros(max((end for _, end in ranges), default=0), dtype=np.uint8)
+        for start, end in ranges:
+            todo[max(start, 0):end] = 1
+        if len(todo):
+            computed = self.status[:len(todo)] != NOT_COMPUTED
+            todo[:len(computed)][computed] = 0
+        starts, lengths, values = run_lengths(todo)
+        return [(int(s), int(s + n)) for s, n, v in zip(starts, lengths, values) if v]
+
+    def set(self, frame_idx, matrix):
+        '''Record the homography of a frame, None when no warp quad was found.'''
+        if matrix is None:
+            self.status[frame_idx] = NOT_FOUND
+        else:
+            self.matrices[frame_idx] = matrix
+            self.status[frame_idx] = VALID
+
+    def lookup(self, start, end):
+        '''(matrices, valid) for frames [start, end); frames outside the store are invalid.'''
+        n = max(end - start, 0)
+        matrices = np.zeros((n, 3, 3))
+        valid = np.zeros(n, dtype=bool)
+        lo, hi = max(start, 0), min(end, len(self))
+        if lo < hi:
+            matrices[lo - start:hi - start] = self.matrices[lo:hi]
+            valid[lo - start:hi - start] = self.status[lo:hi] == VALID
+        return matrices, valid
+
+    def flush(self):
+        for array in (self.matrices, self.status):
+            if isinstance(array, np.memmap):
+                array.flush()
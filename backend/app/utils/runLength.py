@@ -0,0 +1,70 @@
+'''Run-length operations on per-frame 0/1 presence timelines.
+
+Presence is kept as a flat uint8 array with one byte per frame (or
+bit-packed with pack_presence for storage); every operation below is a
+handful of vectorized NumPy calls, so multi-hour recordings stay cheap.
+'''
+import numpy as np
+
+
+def as_presence(presence):
+    '''Return presence as a uint8 array, without copying when it already is one.'''
+    return np.asarray(presence, dtype=np.uint8)
+
+
+def run_lengths(presence):
+    '''Run-length encode presence into (starts, lengths, values) arrays.'''
+    x = as_presence(presence)
+    if x.size == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=np.uint8)
+    starts = np.concatenate(([0], np.flatnonzero(x[1:] != x[:-1]) + 1))
+    lengths = np.diff(np.append(starts, x.size))
+    return starts, lengths, x[starts]
+
+
+def merge_gaps(presence, gap=50):
+    '''Fill every run of 0s of at most gap frames that lies between two runs of 1s.
+
+    Leading and trailing 0s are never filled. Returns a new uint8 array.
+    '''
+    merged = as_presence(presence).copy()
+    starts, lengths, values = run_lengths(merged)
+    inner = (values == 0) & (starts > 0) & (starts + lengths < merged.size) & (lengths <= gap)
+    if inner.any():
+        # Mark +1 at the start and -1 at the end of every gap, the cumulative sum is the fill mask
+        edges = np.zeros(merged.size + 1, dtype=np.int32)
+        edges[starts[inner]] += 1
+        edges[starts[inner] + lengths[inner]] -= 1
+        merged[np.cumsum(edges[:-1]) > 0] = 1
+    return merged
+
+
+def rising_edges(presence):
+    '''Frame indices where presence switches from 0 to 1.'''
+    x = as_presence(presence)
+    return np.flatnonzero(x[1:] > x[:-1]) + 1
+
+
+def falling_edges(presence):
+    '''Frame indices where presence switches from 1 to 0.'''
+    x = as_presence(presence)
+    return np.flatnonzero(x[1:] < x[:-1]) + 1
+
+
+def step_points(presence):
+    '''(x, y) points of the run boundaries, enough to draw presence with a post step plot.'''
+    x = as_presence(presence)
+    starts, _, values = run_lengths(x)
+    if x.size == 0:
+        return starts, values
+    return np.append(starts, x.size - 1), np.append(values, x[-1])
+
+
+def pack_presence(presence):
+    '''Bit-pack presence to one bit per frame; unpack_presence needs the original length.'''
+    return np.packbits(as_presence(presence))
+
+
+def unpack_presence(packed, length):
+    return np.unpackbits(packed, count=length)
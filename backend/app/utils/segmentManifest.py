@@ -0,0 +1,54 @@
+'''Record of the segment outputs in a gaze output folder.
+
+<folder>/manifest.json maps every segment label to the entry it was written
+for: the frame range, the content hashes of the video and gaze, the key of
+all inputs (tags and tracker options included) and the output file. A
+segment whose entry is unchanged and whose output still exists is not
+processed again, so nudging one boundary only recomputes that segment.
+
+Entries are written as soon as a segment's output is saved, which makes the
+manifest a per-segment checkpoint: an interrupted run resumes with the
+segments it had not finished.
+'''
+import json
+import os
+
+
+class SegmentManifest:
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, "manifest.json")
+        self.segments = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    self.segments = json.load(f)["segments"]
+            except (ValueError, KeyError):
+                # Unreadable manifest: everything is processed again
+                self.segments = {}
+
+    def is_current(self, label, entry):
+        '''Whether label's output was written for exactly this entry and still exists.'''
+        return (self.segments.get(label) == entry
+                and os.path.exists(os.path.join(self.folder, entry["output"])))
+
+    def record(self, label, entry):
+        self.segments[label] = entry
+        self.save()
+
+    def prune(self, labels):
+        '''Delete the outputs of segments not in labels, returns the removed labels.'''
+        removed = [label for label in self.segments if label not in labels]
+        for label in removed:
+            out_path = os.path.join(self.folder, self.segments.pop(label)["output"])
+            if os.path.exists(out_path):
+                os.remove(out_path)
+        if removed:
+            self.save()
+        return removed
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"segments": self.segments}, f, indent=2)
+        os.replace(tmp_path, self.path)
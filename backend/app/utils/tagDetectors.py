@@ -0,0 +1,48 @@
+'''Per-thread registry of AprilTag and ArUco detectors.
+
+Building a pupil_apriltags.Detector allocates the native detector and its
+family tables, so each detector is built once per thread (and so once per
+worker process) and reused for every frame. Tuning knobs come from
+APRILTAG_DETECTOR and ARUCO_PARAMETERS in app/config.py.
+'''
+import threading
+
+import cv2
+from pupil_apriltags import Detector
+
+from app import config
+
+_local = threading.local()
+
+
+def _detectors():
+    if not hasattr(_local, "detectors"):
+        _local.detectors = {}
+    return _local.detectors
+
+
+def get_apriltag_detector():
+    '''Return this thread's tag36h11 AprilTag detector.'''
+    detectors = _detectors()
+    if "apriltag" not in detectors:
+        detectors["apriltag"] = Detector(**config.APRILTAG_DETECTOR)
+    return detectors["apriltag"]
+
+
+def get_aruco_detector(dictionary=cv2.aruco.DICT_ARUCO_ORIGINAL):
+    '''Return this thread's cv2.aruco.ArucoDetector for a predefined dictionary.'''
+    detectors = _detectors()
+    key = ("aruco", dictionary)
+    if key not in detectors:
+        parameters = cv2.aruco.DetectorParameters()
+        for name, value in config.ARUCO_PARAMETERS.items():
+            setattr(parameters, name, value)
+        detectors[key] = cv2.aruco.ArucoDetector(cv2.aruco.getPredefinedDictionary(dictionary), parameters)
+    return detectors[key]
+
+
+def warm_up_detectors(aruco_dictionaries=(cv2.aruco.DICT_ARUCO_ORIGINAL,)):
+    '''Build the detectors of the calling thread ahead of the first frame.'''
+    get_apriltag_detector()
+    for dictionary in aruco_dictionaries:
+        get_aruco_detector(dictionary)
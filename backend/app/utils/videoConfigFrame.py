@@ -1,27 +1,35 @@
 import os
 import cv2
 import json
+import shutil
+from contextlib import closing
+from types import SimpleNamespace
 import numpy as np
 from tqdm import tqdm
-from pupil_apriltags import Detector
-from itertools import combinations
+from functools import lru_cache
+from itertools import combinations, repeat
 from flask import current_app
+from app.utils.artifactCache import ArtifactCache, content_hash
+from app.utils.frameSource import FrameSource, split_ranges
+from app.utils.framePipeline import pipelined
+from app.utils.frameRing import shared_frame_pipeline
+from app.utils.homographyStore import HomographyStore
+from app.utils.workerPool import spawn_pool
+from app.utils.segmentManifest import SegmentManifest
+from app.utils.tagDetectors import get_apriltag_detector, get_aruco_detector, warm_up_detectors
 
 
 # ========== HELPER FUNCTIONS ==========
 
 def detect_apriltags(gray_frame):
     '''Detect AprilTags in a grayscale image.'''
-    detector = Detector(families='tag36h11')
-    detections = detector.detect(gray_frame)
+    detections = get_apriltag_detector().detect(gray_frame)
     return {("apriltag", det.tag_id): det for det in detections}
 
 
 def detect_arucos(gray_frame):
     '''Detect ArUco markers in a grayscale image.'''
-    aruco_dict = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_ARUCO_ORIGINAL)
-    parameters = cv2.aruco.DetectorParameters()
-    corners, ids, _ = cv2.aruco.detectMarkers(gray_frame, aruco_dict, parameters=parameters)
+    corners, ids, _ = get_aruco_detector(cv2.aruco.DICT_ARUCO_ORIGINAL).detectMarkers(gray_frame)
     return {("aruco", int(i)): c[0] for i, c in zip(ids.flatten(), corners)} if ids is not None else {}
 
 
@@ -38,6 +46,7 @@ def match_tags_from_json(tag_data, apriltag_map, aruco_map):
                 "id": tag["id"],
                 "ref": np.array([tag["center"]["x"], tag["center"]["y"]]),
                 "img": np.mean(det.corners, axis=0),
+                "corners": det.corners,
                 "center": tuple(int(c) for c in det.center)
             })
 
@@ -51,70 +60,223 @@ def match_tags_from_json(tag_data, apriltag_map, aruco_map):
                 "id": tag["id"],
                 "ref": np.array([tag["center"]["x"], tag["center"]["y"]]),
                 "img": np.mean(corners, axis=0),
+                "corners": corners,
                 "center": tuple(int(c) for c in center)
             })
 
     return matched
 
 
-def calculate_polygon_area(points):
-    '''Calculate the area of a polygon given its vertices.'''
-    x, y = np.array(points).T
-    return 0.5 * np.abs(np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1)))
+@lru_cache(maxsize=None)
+def _quad_combinations(n):
+    '''Index array (n_combinations, 4) of combinations(range(n), 4), in the same order.'''
+    return np.array(list(combinations(range(n), 4)), dtype=np.intp).reshape(-1, 4)
 
 
-def are_three_points_almost_collinear(pts, tol=1000):
-    '''Check if any three points are almost collinear.'''
-    for i in range(4):
-        for j in range(i + 1, 4):
-            for k in range(j + 1, 4):
-                p1, p2, p3 = pts[i], pts[j], pts[k]
-                area = 0.5 * np.abs(
-                    p1[0] * (p2[1] - p3[1]) +
-                    p2[0] * (p3[1] - p1[1]) +
-                    p3[0] * (p1[1] - p2[1])
-                )
-                if area < tol:
-                    return True
-    return False
+# The four triangles of a quad, as indices into its corners
+_QUAD_TRIANGLES = np.array(list(combinations(range(4), 3)))
 
 
-def select_largest_quad(detected_tags):
-    '''Select the largest quadrilateral from detected tags.'''
-    best_quad = None
-    best_area = 0
+def select_largest_quad(detected_tags, tol=1000):
+    '''Select the largest quadrilateral from detected tags.
 
-    for quad in combinations(detected_tags, 4):
-        pts = [tag["center"] for tag in quad]
-        area = calculate_polygon_area(pts)
-        if area > best_area and not are_three_points_almost_collinear(np.array(pts)):
-            best_quad = quad
-            best_area = area
+    Every 4-combination of tag centers is scored in one NumPy batch: the
+    shoelace area of the polygon in detection order, and the areas of its
+    four triangles, a quad with a triangle under tol being almost collinear.
+    Ties go to the first combination, like the loop over
+    itertools.combinations did (kept in benchmarks/bench_quad_selection.py).
+    '''
+    if len(detected_tags) < 4:
+        return None
+    centers = np.array([tag["center"] for tag in detected_tags], dtype=np.float64)
+    combos = _quad_combinations(len(detected_tags))
+    pts = centers[combos]
+    x, y = pts[..., 0], pts[..., 1]
+    areas = 0.5 * np.abs((x * np.roll(y, 1, axis=1)).sum(axis=1) - (y * np.roll(x, 1, axis=1)).sum(axis=1))
+
+    p1, p2, p3 = (pts[:, _QUAD_TRIANGLES[:, i]] for i in range(3))
+    triangles = 0.5 * np.abs(p1[..., 0] * (p2[..., 1] - p3[..., 1]) +
+                             p2[..., 0] * (p3[..., 1] - p1[..., 1]) +
+                             p3[..., 0] * (p1[..., 1] - p2[..., 1]))
+    areas[(triangles < tol).any(axis=1)] = 0
+
+    best = int(np.argmax(areas))
+    if areas[best] <= 0:
+        return None
+    return tuple(detected_tags[i] for i in combos[best])
+
+
+def refine_corners(gray, corners, win=5):
+    '''Refine approximate tag corners to sub-pixel accuracy in small windows of the full-resolution image.'''
+    pts = np.ascontiguousarray(corners, dtype=np.float32).reshape(-1, 1, 2)
+    criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 30, 0.01)
+    cv2.cornerSubPix(gray, pts, (win, win), (-1, -1), criteria)
+    return pts.reshape(-1, 2)
+
+
+def _located_apriltag(tag_id, corners, center):
+    return SimpleNamespace(tag_id=tag_id, corners=corners, center=center)
+
+
+def detect_tags_scaled(gray, scale):
+    '''Detect tags on a downscaled copy of gray, then refine their corners at full resolution.'''
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    win = max(5, int(round(2 / scale)) + 1)
+
+    apriltag_map = {}
+    for key, det in detect_apriltags(small).items():
+        corners = refine_corners(gray, (det.corners + 0.5) / scale - 0.5, win)
+        apriltag_map[key] = _located_apriltag(det.tag_id, corners, np.mean(corners, axis=0))
+    aruco_map = {key: refine_corners(gray, (c + 0.5) / scale - 0.5, win)
+                 for key, c in detect_arucos(small).items()}
+    return apriltag_map, aruco_map
+
+
+def detect_tags_in_rois(gray, rois):
+    '''Detect tags only inside the (x0, y0, x1, y1) regions of gray.'''
+    apriltag_map, aruco_map = {}, {}
+    for x0, y0, x1, y1 in rois:
+        crop = np.ascontiguousarray(gray[y0:y1, x0:x1])
+        offset = np.array([x0, y0])
+        for key, det in detect_apriltags(crop).items():
+            apriltag_map[key] = _located_apriltag(det.tag_id, det.corners + offset, det.center + offset)
+        for key, c in detect_arucos(crop).items():
+            aruco_map[key] = c + offset
+    return apriltag_map, aruco_map
+
+
+def detect_quad(gray, tag_data, scale=1.0, rois=None):
+    '''Detect tags in a grayscale frame and select the four used for the warp.
+
+    Detection runs inside rois when given, on a frame downscaled by scale when
+    scale < 1, and on the whole full-resolution frame otherwise.
+    '''
+    if rois is not None:
+        apriltag_map, aruco_map = detect_tags_in_rois(gray, rois)
+    elif scale < 1:
+        apriltag_map, aruco_map = detect_tags_scaled(gray, scale)
+    else:
+        apriltag_map = detect_apriltags(gray)
+        aruco_map = detect_arucos(gray)
 
-    return best_quad
+    detected_tags = match_tags_from_json(tag_data, apriltag_map, aruco_map)
 
-def detect_tags_and_get_warp(frame, tag_data):
-    '''Detect tags and compute the warp matrix.'''
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    if len(detected_tags) < 4:
+        return None
 
-    apriltag_map = detect_apriltags(gray)
-    aruco_map = detect_arucos(gray)
+    return select_largest_quad(detected_tags)
 
-    detected_tags = match_tags_from_json(tag_data, apriltag_map, aruco_map)
 
-    if len(detected_tags) < 4:
-        return None, None
+def quad_rois(quad, shape, margin):
+    '''Bounding boxes around the tags of quad, grown by margin times the tag size and clipped to shape.'''
+    h, w = shape[:2]
+    rois = []
+    for tag in quad:
+        (x0, y0), (x1, y1) = tag["corners"].min(axis=0), tag["corners"].max(axis=0)
+        pad = margin * max(x1 - x0, y1 - y0)
+        x0, y0 = max(int(x0 - pad), 0), max(int(y0 - pad), 0)
+        x1, y1 = min(int(np.ceil(x1 + pad)) + 1, w), min(int(np.ceil(y1 + pad)) + 1, h)
+        if x1 > x0 and y1 > y0:
+            rois.append((x0, y0, x1, y1))
+    return rois
+
+
+def quad_warp_matrix(quad):
+    '''Perspective transform from the image positions of a quad of tags to their reference positions.'''
+    src_pts = [tag["img"] for tag in quad]
+    dst_pts = [tag["ref"] for tag in quad]
+
+    #print("Selected markers for warp:", [(tag["type"], tag["id"]) for tag in quad])
+
+    return cv2.getPerspectiveTransform(np.array(src_pts, np.float32), np.array(dst_pts, np.float32))
+
 
-    best_quad = select_largest_quad(detected_tags)
+def detect_tags_and_get_warp(frame, tag_data):
+    '''Detect tags and compute the warp matrix.'''
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    best_quad = detect_quad(gray, tag_data)
     if best_quad is None:
         return None, None
 
-    src_pts = [tag["img"] for tag in best_quad]
-    dst_pts = [tag["ref"] for tag in best_quad]
-
-    #print("Selected markers for warp:", [(tag["type"], tag["id"]) for tag in best_quad])
+    return quad_warp_matrix(best_quad), tag_data
+
+
+class TagTracker:
+    '''Locate the warp quad frame after frame, reusing what the previous frames found.
+
+    With interval > 1 the corners of the four selected tags are tracked with
+    Lucas-Kanade optical flow from the previous processed frame. Full
+    detection runs again on the first frame, once `interval` frames have
+    passed since the last detection, and whenever the forward-backward error
+    of any tracked corner exceeds `max_residual` pixels.
+
+    Detection itself first looks only inside ROIs around the previous quad
+    (roi_margin > 0), then on a frame downscaled by `scale` (scale < 1), and
+    falls back to the whole full-resolution frame when tags go missing. With
+    the defaults every frame gets the full detect_tags_and_get_warp treatment.
+    '''
+
+    lk_params = dict(
+        winSize=(21, 21),
+        maxLevel=3,
+        criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 30, 0.01)
+    )
+
+    def __init__(self, tag_data, interval=0, max_residual=1.0, scale=1.0, roi_margin=0.0):
+        self.tag_data = tag_data
+        self.interval = interval
+        self.max_residual = max_residual
+        self.scale = scale
+        self.roi_margin = roi_margin
+        self.prev_gray = None
+        self.quad = None
+        self.detected_at = None
+
+    def track(self, gray):
+        '''Track the current quad into gray, None when tracking is not reliable.'''
+        prev_pts = np.concatenate([tag["corners"] for tag in self.quad]).astype(np.float32).reshape(-1, 1, 2)
+        next_pts, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, prev_pts, None, **self.lk_params)
+        back_pts, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self.prev_gray, next_pts, None, **self.lk_params)
+        if not (status.all() and back_status.all()):
+            return None
+        if np.linalg.norm(back_pts - prev_pts, axis=2).max() > self.max_residual:
+            return None
+
+        quad = []
+        for tag, corners in zip(self.quad, next_pts.reshape(-1, 4, 2)):
+            center = np.mean(corners, axis=0)
+            quad.append(dict(tag, corners=corners, img=center, center=tuple(int(c) for c in center)))
+        return quad
+
+    def detect(self, gray):
+        '''Detect the quad, from the cheapest search to the full-frame scan.'''
+        quad = None
+        if self.roi_margin > 0 and self.quad is not None:
+            quad = detect_quad(gray, self.tag_data, rois=quad_rois(self.quad, gray.shape, self.roi_margin))
+        if quad is None and self.scale < 1:
+            quad = detect_quad(gray, self.tag_data, scale=self.scale)
+        if quad is None:
+            quad = detect_quad(gray, self.tag_data)
+        return quad
+
+    def warp(self, frame_idx, frame):
+        '''Same contract as detect_tags_and_get_warp, for frames fed in increasing order.'''
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        quad = None
+        if self.quad is not None and frame_idx - self.detected_at < self.interval:
+            quad = self.track(gray)
+        if quad is None:
+            quad = self.detect(gray)
+            self.detected_at = frame_idx
+
+        self.prev_gray = gray
+        self.quad = quad
+        if quad is None:
+            return None, None
+        return quad_warp_matrix(quad), self.tag_data
 
-    return cv2.getPerspectiveTransform(np.array(src_pts, np.float32), np.array(dst_pts, np.float32)), tag_data
 
 def warp_and_crop(frame, matrix, meta):
     '''Apply the warp matrix to the frame and crop it.'''
@@ -124,56 +286,288 @@ def warp_and_crop(frame, matrix, meta):
     return warped[b:h+b, b:w+b]
 
 
-def gaze_process(video_path,gaze_path,segment_json,tag_json,output_dir):
+def warp_gaze_arrays(gaze, matrices, valid, meta):
+    '''Map gaze through per-frame warp matrices into integer screen coordinates, in one batch.
+
+    gaze is (n_frames, 2) or (n_gaze, n_frames, 2) for several participants,
+    matrices (n_frames, 3, 3) and valid (n_frames,). Samples without a valid
+    matrix or without gaze become [-1, -1].
+    '''
+    gaze = np.asarray(gaze, dtype=np.float64)
+    homogeneous = np.concatenate([gaze, np.ones(gaze.shape[:-1] + (1,))], axis=-1)
+    warped = np.einsum("nij,...nj->...ni", matrices, homogeneous)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        xy = warped[..., :2] / warped[..., 2:]
+    ok = valid & np.isfinite(xy).all(axis=-1)
+    points = np.full(xy.shape, -1, dtype=np.int64)
+    # astype truncates toward zero, like int()
+    points[ok] = xy[ok].astype(np.int64) - meta["boundary"]
+    return points
+
+
+def segment_gaze(gaze, start, end):
+    '''Gaze samples of frames [start, end), NaN where the gaze array has none.'''
+    samples = np.full((max(end - start, 0), 2), np.nan)
+    lo, hi = max(start, 0), min(end, len(gaze))
+    if lo < hi:
+        samples[lo - start:hi - start] = gaze[lo:hi]
+    return samples
+
+
+def homography_frames(source, tag_data, ranges, tracking_interval=0, tracking_max_residual=1.0,
+                      detect_scale=1.0, detect_roi_margin=0.0, threads=1, prefetch=16, processes=0):
+    '''Yield (frame_idx, warp matrix or None) for every frame in ranges.
+
+    The warp quad is located by a TagTracker, see there for the tracking and
+    detection options. Frames are decoded ahead on a reader thread, see
+    app/utils/framePipeline.py. Without tracking or ROIs every frame is
+    detected on its own and `threads` frames are detected in parallel, or
+    with processes > 0 in worker processes reading the grayscale frames from
+    shared memory (app/utils/frameRing.py); a tracker that carries state
+    between frames gets a single thread.
+    '''
+    tracker = TagTracker(tag_data, tracking_interval, tracking_max_residual, detect_scale, detect_roi_margin)
+    stateless = tracking_interval <= 1 and detect_roi_margin <= 0
+    if stateless and processes > 0:
+        tracker_options = dict(tracking_interval=tracking_interval, tracking_max_residual=tracking_max_residual,
+                               detect_scale=detect_scale, detect_roi_margin=detect_roi_margin)
+        yield from shared_frame_pipeline(source.frames(ranges), _gray_homography, processes, prefetch,
+                                         initializer=_init_worker, initargs=(tag_data, tracker_options))
+        return
+
+    def warp(frame_idx, frame):
+        if frame is None:
+            return None
+        if not stateless:
+            return tracker.warp(frame_idx, frame)[0]
+        # Same as tracker.warp without touching the tracker's state, so threads can share it
+        quad = tracker.detect(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+        return None if quad is None else quad_warp_matrix(quad)
+
+    yield from pipelined(source.frames(ranges), warp, threads if stateless else 1, prefetch)
+
+
+# Per-process state of the gaze_process worker pool, set once by _init_worker
+_worker_state = {}
+
+
+def _init_worker(tag_data, tracker_options):
+    _worker_state["tag_data"] = tag_data
+    _worker_state["tracker_options"] = tracker_options
+    warm_up_detectors()
+
+
+def _gray_homography(frame_idx, gray):
+    '''Worker side of the shared frame ring: warp matrix of one grayscale frame, without tracking.'''
+    quad = TagTracker(_worker_state["tag_data"], scale=_worker_state["tracker_options"]["detect_scale"]).detect(gray)
+    return None if quad is None else quad_warp_matrix(quad)
+
+
+def _homography_chunk(video_path, start, end):
+    '''Worker entry point: warp matrices of one chunk of frames with its own capture.'''
+    with FrameSource(video_path) as source:
+        return list(homography_frames(source, _worker_state["tag_data"], [(start, end)],
+                                      **_worker_state["tracker_options"]))
+
+
+def gaze_process(video_path, gaze_path, segment_json, tag_json, output_dir, **options):
+    '''Warp one gaze file, see process_gaze_files for the options.'''
+    return process_gaze_files(video_path, [(gaze_path, output_dir)], segment_json, tag_json, **options)
+
+
+def gaze_process_participants(video_path, gaze_paths, segment_json, tag_json, output_dir, **options):
+    '''Warp the gaze of every participant, {participant: gaze .npy}, in one pass over the video.
+
+    The outputs of each participant go to output_dir/<participant>/, see
+    process_gaze_files for the options.
+    '''
+    gaze_outputs = []
+    for participant, gaze_path in gaze_paths.items():
+        participant_dir = os.path.join(output_dir, participant)
+        os.makedirs(participant_dir, exist_ok=True)
+        gaze_outputs.append((gaze_path, participant_dir))
+    return process_gaze_files(video_path, gaze_outputs, segment_json, tag_json, **options)
+
+
+def process_gaze_files(video_path, gaze_outputs, segment_json, tag_json, workers=1, chunk_frames=750,
+                       tracking_interval=0, tracking_max_residual=1.0, detect_scale=1.0, detect_roi_margin=0.0,
+                       progress=None, cache=None, threads=1, prefetch=16, processes=0):
+    '''Warp the gaze of every segment into screen coordinates, one {label}.npy per segment.
+
+    gaze_outputs lists (gaze .npy, output folder) pairs. Every frame is
+    decoded and detected once, however many gaze files there are, and each
+    segment is warped for all of them in one batch.
+
+    With workers > 1 the segment frames are split into chunks of at most
+    chunk_frames frames and processed by a pool of worker processes, each with
+    its own video capture. Results are reassembled in frame order. With
+    workers = 1 frames are decoded up to `prefetch` frames ahead and
+    detected on `threads` threads, or in `processes` worker processes fed
+    through shared memory, see homography_frames.
+
+    With tracking_interval > 1 tags are fully detected at most every
+    tracking_interval frames and tracked with optical flow in between.
+    detect_scale < 1 detects on downscaled frames and detect_roi_margin > 0
+    searches around the previous tag positions first, see TagTracker.
+
+    progress, when given, replaces the tqdm bar: it is called with
+    frames_done/frames_total, segments_done/segments_total and, while inside
+    a segment, segment/segment_done/segment_total keyword arguments.
+
+    With an ArtifactCache as cache, the output of every segment is cached
+    under the video, gaze and tags content plus the frame range and tracker
+    options; segments cached for every stale output are copied without decoding.
+
+    Tag detection is independent of the gaze: the warp matrix of every frame
+    goes into a HomographyStore, persisted in the cache (stage "homographies",
+    keyed by the video content, tags and tracker options) when given, and
+    only frames the store has not seen are decoded. Each segment's gaze is
+    then warped in one batch, see warp_gaze_arrays.
+
+    Each output folder keeps a SegmentManifest: segments whose frame range
+    and inputs are unchanged since their output was written are skipped,
+    outputs of segments that were removed are deleted, and an interrupted run
+    resumes after the last segment it saved. Returns the labels that were
+    processed, unchanged and removed.
+    '''
     # Load gaze and segment info
-    gaze = np.load(gaze_path, allow_pickle=True)
+    gazes = [np.load(gaze_path, allow_pickle=True) for gaze_path, _ in gaze_outputs]
     with open(segment_json) as f:
-        segments = json.load(f)
+        segments = json.load(f)[13:]
     with open(tag_json) as f:
         tag_data = json.load(f)
-
-    cap = cv2.VideoCapture(video_path)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-
-    for seg in segments[13:]:
-        start, end, label = seg["start"], seg["end"], seg["label"]
-        warped_points = []
-
-        print(f"Processing segment: {label} ({start}-{end})")
-        for frame_idx in tqdm(range(start, end)):
-            
-            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-            ret, frame = cap.read()
-            if not ret:
-                warped_points.append([-1, -1])
-                continue
-
-            gp = gaze[frame_idx]
-            if np.isnan(gp[0]):
-                warped_points.append([-1, -1])
+    tracker_options = dict(
+        tracking_interval=tracking_interval,
+        tracking_max_residual=tracking_max_residual,
+        detect_scale=detect_scale,
+        detect_roi_margin=detect_roi_margin
+    )
+
+    # Outputs recorded in each folder's manifest for the same inputs are kept,
+    # those of segments no longer in segment_json are deleted
+    video_hash = content_hash(video_path)
+    gaze_hashes = [content_hash(gaze_path) for gaze_path, _ in gaze_outputs]
+    manifests = [SegmentManifest(output_dir) for _, output_dir in gaze_outputs]
+    labels = {seg["label"] for seg in segments}
+    summary = {"processed": [], "unchanged": [], "removed": []}
+    for manifest in manifests:
+        summary["removed"] += [label for label in manifest.prune(labels) if label not in summary["removed"]]
+
+    # (gaze index, label) -> manifest entry, its key is also the cache key
+    entries = {}
+    todo = []
+    for seg in segments:
+        stale = []
+        for i, (gaze_hash, manifest) in enumerate(zip(gaze_hashes, manifests)):
+            entry = entries[i, seg["label"]] = {
+                "start": seg["start"],
+                "end": seg["end"],
+                "video": video_hash,
+                "gaze": gaze_hash,
+                "key": ArtifactCache.key(video_hash, gaze_hash, tag_data, tracker_options, seg["start"], seg["end"]),
+                "output": f"{seg['label']}.npy"
+            }
+            if not manifest.is_current(seg["label"], entry):
+                stale.append(i)
+        if not stale:
+            summary["unchanged"].append(seg["label"])
+            print(f"Segment {seg['label']} ({seg['start']}-{seg['end']}) unchanged")
+            continue
+        if cache is not None:
+            # An entry evicted since the last run (or while it is copied) is a miss; outputs copied
+            # before it are rewritten with the same content when the segment is processed
+            if all(cache.fetch("gaze_segments", entries[i, seg["label"]]["key"], ".npy",
+                               os.path.join(gaze_outputs[i][1], f"{seg['label']}.npy")) for i in stale):
+                for i in stale:
+                    manifests[i].record(seg["label"], entries[i, seg["label"]])
+                summary["processed"].append(seg["label"])
+                print(f"Segment {seg['label']} ({seg['start']}-{seg['end']}) taken from cache")
                 continue
-
-            # Detect tags
-            warp_matrix, meta = detect_tags_and_get_warp(frame, tag_data)
-            
-            if warp_matrix is None:
-                warped_points.append([-1, -1])
-                continue
-
-            # Warp gaze
-            gp_homo = np.array([[gp[0], gp[1], 1]]).T
-            warped = warp_matrix @ gp_homo
-            warped /= warped[2]
-            xw, yw = int(warped[0]), int(warped[1])
-            b = meta["boundary"]
-            warped_points.append([xw - b, yw - b])
-            # if 0 <= xw - b < meta["screen_width"] and 0 <= yw - b < meta["screen_height"]:
-            #     warped_points.append([xw - b, yw - b])
-            # else:
-            #     warped_points.append([-1, -1])
-
-        out_path = os.path.join(output_dir, f"{label}.npy")
-        np.save(out_path, np.array(warped_points))
-        print(f"Saved warped gaze: {out_path}")
-
-    cap.release()
+        todo.append(seg)
+    segments = todo
+    if not segments:
+        return summary
+
+    # Frames are decoded once, in file order, even when segments overlap, and
+    # only when the homography store doesn't have them yet.
+    # Each segment is written out as soon as its last frame has been processed.
+    ranges = [(seg["start"], seg["end"]) for seg in segments]
+    store_inputs = {"video": video_hash, "tags": tag_data, "tracker_options": tracker_options}
+    store_dir = None
+    if cache is not None:
+        store_dir = cache.folder_entry("homographies", ArtifactCache.key(video_hash, tag_data, tracker_options))
+    store = HomographyStore(store_dir, store_inputs)
+    store.ensure(max(end for _, end in ranges))
+    missing = store.missing(ranges)
+    pending = sorted(segments, key=lambda seg: seg["end"])
+
+    def flush(upto):
+        while pending and pending[0]["end"] <= upto:
+            seg = pending.pop(0)
+            start, end, label = seg["start"], seg["end"], seg["label"]
+            print(f"Processing segment: {label} ({start}-{end})")
+            if end > start:
+                matrices, valid = store.lookup(start, end)
+                samples = np.stack([segment_gaze(gaze, start, end) for gaze in gazes])
+                warped = warp_gaze_arrays(samples, matrices, valid, tag_data)
+            else:
+                # Empty (or reversed) segment: an empty array, as the per-frame loop wrote
+                warped = np.zeros((len(gazes), 0))
+            for i, (_, output_dir) in enumerate(gaze_outputs):
+                out_path = os.path.join(output_dir, f"{label}.npy")
+                np.save(out_path, warped[i])
+                print(f"Saved warped gaze: {out_path}")
+                if cache is not None:
+                    cache.store("gaze_segments", entries[i, label]["key"], ".npy",
+                                lambda tmp_path: shutil.copyfile(out_path, tmp_path))
+            store.flush()
+            # Checkpoint: a resumed run skips this segment
+            for i, manifest in enumerate(manifests):
+                manifest.record(label, entries[i, label])
+            summary["processed"].append(label)
+
+    total = sum(end - start for start, end in missing)
+
+    def report(frame_idx, frames_done):
+        if progress is None:
+            return
+        fields = dict(frames_done=frames_done, frames_total=total,
+                      segments_done=len(segments) - len(pending), segments_total=len(segments))
+        for seg in pending:
+            if seg["start"] <= frame_idx < seg["end"]:
+                fields.update(segment=seg["label"], segment_done=frame_idx + 1 - seg["start"],
+                              segment_total=seg["end"] - seg["start"])
+                break
+        progress(**fields)
+
+    # Segments made only of frames the store already has
+    flush(missing[0][0] if missing else float("inf"))
+    if workers > 1 and missing:
+        chunks = split_ranges(missing, chunk_frames)
+        # A cancelled job leaves the pool without waiting for the chunks still queued
+        with spawn_pool(workers, _init_worker, (tag_data, tracker_options)) as pool, \
+                tqdm(total=total, disable=progress is not None) as bar:
+            starts, ends = [c[0] for c in chunks], [c[1] for c in chunks]
+            frames_done = 0
+            for chunk in pool.map(_homography_chunk, repeat(video_path, len(chunks)), starts, ends):
+                for frame_idx, warp_matrix in chunk:
+                    store.set(frame_idx, warp_matrix)
+                frames_done += len(chunk)
+                bar.update(len(chunk))
+                flush(chunk[-1][0] + 1)
+                report(chunk[-1][0], frames_done)
+    elif missing:
+        # The pipeline is closed before the capture is released, also when progress cancels the job
+        with FrameSource(video_path) as source, \
+                closing(homography_frames(source, tag_data, missing, threads=threads, prefetch=prefetch,
+                                          processes=processes, **tracker_options)) as frames:
+            for frames_done, (frame_idx, warp_matrix) in enumerate(tqdm(frames, total=total, disable=progress is not None), 1):
+                store.set(frame_idx, warp_matrix)
+                if pending and pending[0]["end"] <= frame_idx + 1:
+                    flush(frame_idx + 1)
+                report(frame_idx, frames_done)
+    flush(float("inf"))
+    if cache is not None:
+        # The store grew in place, count it against the cache size
+        cache.evict()
+    return summary
@@ -8,54 +8,232 @@ import base64
 
 import json
 import os
+import sys
+from array import array
+from contextlib import closing
+from itertools import takewhile
+from concurrent.futures import as_completed
 
-def detect_markers(video_path):
-    aruco_dict = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50)
-    parameters = cv2.aruco.DetectorParameters()
+from app import config
+from app.utils.artifactCache import content_hash
+from app.utils.frameSource import FrameSource
+from app.utils.framePipeline import pipelined
+from app.utils.frameRing import shared_frame_pipeline
+from app.utils.runLength import (
+    as_presence, merge_gaps, rising_edges, falling_edges, step_points, pack_presence, unpack_presence
+)
+from app.utils.tagDetectors import get_aruco_detector, warm_up_detectors
+from app.utils.workerPool import spawn_pool
+
+def marker_presence(frame, detector):
+    '''Return (marker_0, marker_1) presence flags for one frame, 1 when more than two copies are visible.'''
+    return gray_marker_presence(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), detector)
+
+def gray_marker_presence(gray, detector):
+    '''marker_presence of a frame already converted to grayscale.'''
+    corners, ids, _ = detector.detectMarkers(gray)
+    ids_list = ids.flatten().tolist() if ids is not None else []
+    return (1 if ids_list.count(0) > 2 else 0), (1 if ids_list.count(1) > 2 else 0)
+
+def _frame_marker_presence(frame_idx, frame):
+    '''marker_presence with the calling thread's detector, for the frame pipeline.'''
+    return marker_presence(frame, get_aruco_detector(cv2.aruco.DICT_4X4_50))
+
+def _gray_marker_presence(frame_idx, gray):
+    '''Worker side of the shared frame ring, gray is a view of a ring slot.'''
+    return gray_marker_presence(gray, get_aruco_detector(cv2.aruco.DICT_4X4_50))
+
+def readable_frames(source, start=0, end=sys.maxsize):
+    '''(frame_idx, frame) of frames [start, end), stopping at the first frame that can't be read.'''
+    return takewhile(lambda item: item[1] is not None, source.frames([(start, end)]))
+
+def detect_markers(video_path, step=1, workers=1, progress=None, cache=None, threads=1, prefetch=16, processes=0,
+                   chunk_frames=300):
+    '''Per-frame presence of markers 0 and 1 over the whole video.
+
+    With step > 1 only every step-th frame is decoded and detected, and the
+    exact frame of every change between two samples is found by bisection,
+    see detect_markers_coarse. Otherwise, with workers > 1, the video is
+    split into ranges of chunk_frames frames scanned by a process pool, see
+    detect_markers_parallel. The full scan in this process decodes on a
+    reader thread, up to `prefetch` frames ahead, and detects on `threads`
+    threads, see app/utils/framePipeline.py, or with processes > 0 in that
+    many worker processes reading the frames from shared memory, see
+    app/utils/frameRing.py.
+
+    progress, when given, is called with frames_done/frames_total keyword
+    arguments as the scan advances (frames_total is the container's estimate).
+
+    With an ArtifactCache as cache the bit-packed timelines are cached under
+    the video content hash, step and ARUCO_PARAMETERS.
+    '''
+    if cache is not None:
+        key = cache.key(content_hash(video_path), step, config.ARUCO_PARAMETERS)
+        cached = cache.load_arrays("markers", key)
+        if cached is not None:
+            length = int(cached["length"])
+            return unpack_presence(cached["m0"], length), unpack_presence(cached["m1"], length), float(cached["fps"])
+        marker_0, marker_1, fps = detect_markers(video_path, step, workers, progress, threads=threads, prefetch=prefetch,
+                                                 processes=processes, chunk_frames=chunk_frames)
+        cache.save_arrays("markers", key, m0=pack_presence(marker_0), m1=pack_presence(marker_1),
+                          length=len(marker_0), fps=fps)
+        return marker_0, marker_1, fps
+
+    if step > 1:
+        return detect_markers_coarse(video_path, step, progress)
+    if workers > 1:
+        return detect_markers_parallel(video_path, workers, progress, chunk_frames)
+
+    # One byte per frame, handed to NumPy without a copy at the end
+    marker_0_presence = array('B')
+    marker_1_presence = array('B')
+    print("detecting now")
+    with FrameSource(video_path) as source:
+        fps, frame_count = source.fps, source.frame_count
+        if processes > 0:
+            results = shared_frame_pipeline(readable_frames(source), _gray_marker_presence, processes, prefetch,
+                                            initializer=_init_marker_worker)
+        else:
+            results = pipelined(readable_frames(source), _frame_marker_presence, threads, prefetch)
+        # Stop the pipeline before the capture is released, also when progress cancels the job
+        with closing(results):
+            for _, (m0, m1) in results:
+                marker_0_presence.append(m0)
+                marker_1_presence.append(m1)
+                if progress is not None:
+                    progress(frames_done=len(marker_0_presence), frames_total=frame_count)
+    print("detection finished")
+    return as_presence(marker_0_presence), as_presence(marker_1_presence), fps
+
+def detect_markers_coarse(video_path, step, progress=None):
+    '''Coarse-to-fine version of detect_markers.
+
+    Frames 0, step, 2*step, ... build a coarse presence timeline. Where two
+    neighbouring samples disagree the transition frame is bisected with
+    single-frame probes, and the last readable frame is bisected the same way.
+    The result equals the full scan as long as no marker state lasts less
+    than step frames; shorter off-gaps between two on-runs are merged by
+    merge_intervals anyway. progress receives frames_done (the highest frame
+    sampled so far) and frames_total during the coarse pass.
+    '''
+    detector = get_aruco_detector(cv2.aruco.DICT_4X4_50)
+    probed = {}
+
+    with FrameSource(video_path) as source:
+        fps = source.fps
+
+        def probe(frame_idx):
+            if frame_idx not in probed:
+                _, frame = next(source.frames([(frame_idx, frame_idx + 1)]))
+                probed[frame_idx] = None if frame is None else marker_presence(frame, detector)
+            return probed[frame_idx]
+
+        print("detecting now")
+        samples = []
+        frame_idx = 0
+        while probe(frame_idx) is not None:
+            samples.append(frame_idx)
+            frame_idx += step
+            if progress is not None:
+                progress(frames_done=min(frame_idx, source.frame_count), frames_total=source.frame_count)
+        if not samples:
+            print("detection finished")
+            return as_presence([]), as_presence([]), fps
+
+        # The last readable frame lies between the last good sample and frame_idx
+        lo, hi = samples[-1], frame_idx
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if probe(mid) is None:
+                hi = mid
+            else:
+                lo = mid
+        if lo != samples[-1]:
+            samples.append(lo)
+
+        presence = [np.zeros(lo + 1, dtype=np.uint8), np.zeros(lo + 1, dtype=np.uint8)]
+        for m in (0, 1):
+            presence[m][samples[-1]] = probed[samples[-1]][m]
+            for a, b in zip(samples, samples[1:]):
+                va, vb = probed[a][m], probed[b][m]
+                if va == vb:
+                    presence[m][a:b] = va
+                    continue
+                lo, hi = a, b
+                while hi - lo > 1:
+                    mid = (lo + hi) // 2
+                    if probe(mid)[m] == va:
+                        lo = mid
+                    else:
+                        hi = mid
+                presence[m][a:hi] = va
+                presence[m][hi:b] = vb
+        print(f"detection finished, {len(probed)} frames probed")
+
+    return presence[0], presence[1], fps
+
+def _init_marker_worker():
+    warm_up_detectors(aruco_dictionaries=(cv2.aruco.DICT_4X4_50,))
+
+def _marker_chunk(video_path, start, end):
+    '''Worker entry point: presence arrays for frames [start, end), stopping at the end of the video.'''
+    marker_0_presence = array('B')
+    marker_1_presence = array('B')
+    with FrameSource(video_path) as source:
+        # Decode the next frames while this one is detected
+        for _, (m0, m1) in pipelined(readable_frames(source, start, end), _frame_marker_presence):
+            marker_0_presence.append(m0)
+            marker_1_presence.append(m1)
+    return as_presence(marker_0_presence), as_presence(marker_1_presence)
+
+def detect_markers_parallel(video_path, workers, progress=None, chunk_frames=300):
+    '''detect_markers over frame ranges of chunk_frames frames, scanned by `workers` processes.
+
+    Every range has its own capture and seek. Small ranges keep progress
+    coming and let a cancelled job (progress raises) stop after the ranges in
+    flight instead of after a whole 1/workers of the video. The last range is
+    open-ended because CAP_PROP_FRAME_COUNT is only an estimate; a range that
+    hits the end of the video early ends the timeline.
+    '''
     cap = cv2.VideoCapture(video_path)
     fps = cap.get(cv2.CAP_PROP_FPS)
-    marker_0_presence = []
-    marker_1_presence = []
-    print("detecting now")
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
 
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        corners, ids, _ = cv2.aruco.detectMarkers(gray, aruco_dict, parameters=parameters)
-        ids_list = ids.flatten().tolist() if ids is not None else []
+    starts = list(range(0, max(frame_count, 1), chunk_frames))
+    ends = starts[1:] + [sys.maxsize]
 
-        marker_0_presence.append(1 if ids_list.count(0) > 2 else 0)
-        marker_1_presence.append(1 if ids_list.count(1) > 2 else 0)
+    print("detecting now")
+    # A cancelled job leaves the pool without waiting for the ranges still queued
+    with spawn_pool(workers, _init_marker_worker) as pool:
+        futures = {pool.submit(_marker_chunk, video_path, start, end): i for i, (start, end) in enumerate(zip(starts, ends))}
+        chunks = [None] * len(starts)
+        frames_done = 0
+        for future in as_completed(futures):
+            chunk = chunks[futures[future]] = future.result()
+            frames_done += len(chunk[0])
+            if progress is not None:
+                progress(frames_done=frames_done, frames_total=frame_count)
     print("detection finished")
-    cap.release()
+
+    # The timeline ends with the first range cut short by the end of the video
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        if len(chunks[i][0]) < end - start:
+            chunks = chunks[:i + 1]
+            break
+    marker_0_presence = np.concatenate([m0 for m0, _ in chunks])
+    marker_1_presence = np.concatenate([m1 for _, m1 in chunks])
     return marker_0_presence, marker_1_presence, fps
 
 def merge_intervals(binary_list, gap=50):
-    merged = binary_list[:]
-    i = 0
-    while i < len(merged):
-        if merged[i] == 1:
-            j = i + 1
-            while j < len(merged) and merged[j] == 1:
-                j += 1
-            gap_start = j
-            while j < len(merged) and merged[j] == 0:
-                j += 1
-            if j < len(merged) and (j - gap_start) <= gap:
-                for k in range(gap_start, j):
-                    merged[k] = 1
-            i = j
-        else:
-            i += 1
-    return merged
+    '''Fill gaps of at most gap frames between runs of 1s, see runLength.merge_gaps.'''
+    return merge_gaps(binary_list, gap)
 
 def compute_segment_indices(marker_0, marker_1):
-    m0 = np.array(merge_intervals(marker_0))
-    m1 = np.array(merge_intervals(marker_1))
-    start_indices = np.where(np.diff(m0) < 0)[0] + 1
-    end_indices = np.where(np.diff(m1) > 0)[0] + 1
+    m0 = merge_gaps(marker_0)
+    m1 = merge_gaps(marker_1)
+    start_indices = falling_edges(m0)
+    end_indices = rising_edges(m1)
     n = min(len(start_indices), len(end_indices))
     return m0, m1, start_indices[:n].tolist(), end_indices[:n].tolist()
 
@@ -75,8 +253,9 @@ def assign_labels(start_indices, light, head, media):
 
 def generate_plot(marker_0, marker_1):
     fig, ax = plt.subplots(figsize=(20, 3))
-    ax.plot(marker_0, label='marker-0', color='blue')
-    ax.plot(marker_1, label='marker-1', color='orange')
+    # Only the run boundaries are plotted, a step plot draws the same timeline
+    ax.step(*step_points(marker_0), where='post', label='marker-0', color='blue')
+    ax.step(*step_points(marker_1), where='post', label='marker-1', color='orange')
     ax.legend()
     ax.set_title("Marker Presence Timeline")
 
@@ -0,0 +1,44 @@
+'''Worker pools of the video stages, and how they are shut down.
+
+Worker processes are started with spawn, not fork: forking a process that
+already ran OpenCV can deadlock its thread pool in the child, since only the
+forking thread survives and locks held by the others stay locked. Spawned
+workers import what they need themselves, so their work functions and
+initializers must be module level.
+
+A pool's own `with` block waits for every queued task on exit. When the
+caller stops collecting results early (a cancelled job, a failed chunk, a
+consumer that went away) that means finishing work nobody will read, so the
+pools are wrapped in cancelling() instead.
+'''
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+
+def make_spawn_pool(workers, initializer=None, initargs=()):
+    '''ProcessPoolExecutor of `workers` spawned processes.'''
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=initializer, initargs=initargs)
+
+
+@contextmanager
+def cancelling(pool, wait=False):
+    '''Shut an executor down when the block exits.
+
+    A normal exit waits for the pool as usual. On an exception, GeneratorExit
+    included, the queued tasks are cancelled and the pool is shut down
+    without waiting for the running ones, unless wait is True (when they use
+    something the caller frees next).
+    '''
+    try:
+        yield pool
+    except BaseException:
+        pool.shutdown(wait=wait, cancel_futures=True)
+        raise
+    pool.shutdown()
+
+
+def spawn_pool(workers, initializer=None, initargs=()):
+    '''cancelling(make_spawn_pool(...)), for `with spawn_pool(...) as pool:`.'''
+    return cancelling(make_spawn_pool(workers, initializer, initargs))
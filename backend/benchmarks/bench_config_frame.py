@@ -0,0 +1,56 @@
+'''extractFrame with tag detection on the whole warped canvas, on its boundary bands only and on the source image.
+
+Prints latency, peak traced memory and the tags found in each mode, and for
+"bands" and "source" whether they found the same tags as "warped" and the
+largest center difference. Tags are keyed by (family, id), AprilTag and ArUco
+ids overlap.
+
+Usage (from backend/):
+    python -m benchmarks.bench_config_frame path/to/photo.png 150,88 1100,108 1120,648 130,628
+(the screen corners in image pixels, clockwise from top left)
+'''
+import argparse
+import time
+import tracemalloc
+
+import cv2
+
+from app.utils.generateConfigFrame import extractFrame
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image")
+    parser.add_argument("corners", nargs=4, help="x,y of the screen corners in image pixels")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    image = cv2.imread(args.image)
+    # extractFrame takes the points in the 500 px wide display of the frontend
+    scale = image.shape[1] / 500
+    corners = [[float(v) / scale for v in corner.split(",")] for corner in args.corners]
+    points = [{"x": x, "y": y} for x, y in corners] * 2
+
+    centers = {}
+    for mode in ("warped", "bands", "source"):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            result = extractFrame(image, points, detect_on=mode)
+        elapsed = (time.perf_counter() - t0) / args.repeat
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        centers[mode] = {(family, tag["id"]): (tag["center"]["x"], tag["center"]["y"])
+                         for family in ("apriltags", "arucos") for tag in result["tags"][family]}
+        print(f"{mode:>6}: {elapsed * 1000:7.1f} ms, peak {peak / 1e6:6.1f} MB, tags {sorted(centers[mode])}")
+
+    for mode in ("bands", "source"):
+        missing = centers["warped"].keys() - centers[mode].keys()
+        extra = centers[mode].keys() - centers["warped"].keys()
+        common = centers["warped"].keys() & centers[mode].keys()
+        diff = max((max(abs(a - b) for a, b in zip(centers["warped"][k], centers[mode][k])) for k in common), default=0)
+        print(f"{mode:>6} vs warped: missing {sorted(missing)}, extra {sorted(extra)}, largest center difference {diff} px")
+
+
+if __name__ == "__main__":
+    main()
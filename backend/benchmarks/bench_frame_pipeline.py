@@ -0,0 +1,97 @@
+'''Serial decode-then-detect loops against the pipelined frame engine.
+
+Runs the marker scan of detect_markers and the homography pass of
+gaze_process once per thread count, and once per worker process count with
+the shared-memory frame ring, on the same frames, and checks the results
+match the serial loop. The gain depends on the cores available and
+on how detection and decoding cost compare for the video.
+
+Usage (from backend/):
+    python -m benchmarks.bench_frame_pipeline path/to/video.mp4 path/to/tags.json --frames 750 --threads 1 2 4 --processes 2 4
+'''
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+from app.utils.frameSource import FrameSource
+from app.utils.framePipeline import pipelined
+from app.utils.frameRing import shared_frame_pipeline
+from app.utils.tagDetectors import get_aruco_detector
+from app.utils.videoConfigFrame import detect_tags_and_get_warp, homography_frames
+from app.utils.videoSegment import _frame_marker_presence, _gray_marker_presence, _init_marker_worker, marker_presence
+
+
+def serial_markers(video_path, frames):
+    detector = get_aruco_detector(cv2.aruco.DICT_4X4_50)
+    with FrameSource(video_path) as source:
+        return [marker_presence(frame, detector) for _, frame in source.frames([(0, frames)])]
+
+
+def pipelined_markers(video_path, frames, threads):
+    with FrameSource(video_path) as source:
+        return [result for _, result in pipelined(source.frames([(0, frames)]), _frame_marker_presence, threads)]
+
+
+def ring_markers(video_path, frames, processes):
+    with FrameSource(video_path) as source:
+        return [result for _, result in shared_frame_pipeline(source.frames([(0, frames)]), _gray_marker_presence,
+                                                              processes, initializer=_init_marker_worker)]
+
+
+def serial_homographies(video_path, tag_data, frames):
+    with FrameSource(video_path) as source:
+        return [detect_tags_and_get_warp(frame, tag_data)[0] for _, frame in source.frames([(0, frames)])]
+
+
+def pipelined_homographies(video_path, tag_data, frames, threads=1, processes=0):
+    with FrameSource(video_path) as source:
+        return [matrix for _, matrix in homography_frames(source, tag_data, [(0, frames)], threads=threads,
+                                                          processes=processes)]
+
+
+def same_matrices(a, b):
+    return all((x is None and y is None) or (x is not None and y is not None and np.array_equal(x, y))
+               for x, y in zip(a, b))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video")
+    parser.add_argument("tags", help="tags.json of the screen")
+    parser.add_argument("--frames", type=int, default=750)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--processes", type=int, nargs="*", default=[2, 4])
+    args = parser.parse_args()
+    with open(args.tags) as f:
+        tag_data = json.load(f)
+
+    t0 = time.perf_counter()
+    expected = serial_markers(args.video, args.frames)
+    print(f"markers      serial: {args.frames / (time.perf_counter() - t0):8.1f} frames/s")
+    for threads in args.threads:
+        t0 = time.perf_counter()
+        assert pipelined_markers(args.video, args.frames, threads) == expected
+        print(f"markers   {threads:2d} threads: {args.frames / (time.perf_counter() - t0):8.1f} frames/s")
+    for processes in args.processes:
+        t0 = time.perf_counter()
+        assert ring_markers(args.video, args.frames, processes) == expected
+        print(f"markers {processes:2d} processes: {args.frames / (time.perf_counter() - t0):8.1f} frames/s")
+
+    t0 = time.perf_counter()
+    expected = serial_homographies(args.video, tag_data, args.frames)
+    print(f"homography   serial: {args.frames / (time.perf_counter() - t0):8.1f} frames/s")
+    for threads in args.threads:
+        t0 = time.perf_counter()
+        assert same_matrices(pipelined_homographies(args.video, tag_data, args.frames, threads=threads), expected)
+        print(f"homography {threads:2d} threads: {args.frames / (time.perf_counter() - t0):8.1f} frames/s")
+    for processes in args.processes:
+        t0 = time.perf_counter()
+        assert same_matrices(pipelined_homographies(args.video, tag_data, args.frames, processes=processes), expected)
+        print(f"homography {processes:2d} processes: {args.frames / (time.perf_counter() - t0):8.1f} frames/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+'''Decode throughput of the old seek-per-frame loop against FrameSource.
+
+Usage (from backend/):
+    python -m benchmarks.bench_frame_source path/to/video.mp4 --start 1000 --frames 750
+'''
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from app.utils.frameSource import FrameSource
+from app.utils.runLength import run_lengths
+
+
+def seek_per_frame(video_path, ranges):
+    cap = cv2.VideoCapture(video_path)
+    for start, end in ranges:
+        for frame_idx in range(start, end):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+            cap.read()
+    cap.release()
+
+
+def sequential(video_path, ranges):
+    with FrameSource(video_path) as source:
+        for _ in source.frames(ranges):
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video")
+    parser.add_argument("--start", type=int, default=0)
+    parser.add_argument("--frames", type=int, default=750, help="number of frames to read (30 s at 25 fps)")
+    parser.add_argument("--nan-ratio", type=float, default=0.2,
+                        help="fraction of frames without a gaze sample, left out of the ranges "
+                             "(FrameSource grabs through the gaps)")
+    args = parser.parse_args()
+
+    wanted = np.random.default_rng(0).random(args.frames) >= args.nan_ratio
+    starts, lengths, values = run_lengths(wanted)
+    ranges = [(args.start + int(s), args.start + int(s + n)) for s, n, v in zip(starts, lengths, values) if v]
+
+    for name, fn in (("seek per frame", seek_per_frame), ("FrameSource", sequential)):
+        t0 = time.perf_counter()
+        fn(args.video, ranges)
+        elapsed = time.perf_counter() - t0
+        print(f"{name:>16}: {args.frames / elapsed:8.1f} frames/s ({elapsed:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
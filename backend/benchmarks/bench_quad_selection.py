@@ -0,0 +1,82 @@
+'''The combinations loop select_largest_quad used to run (with its two helpers) against the batched version.
+
+Random tag layouts with n visible tags (with nearly collinear rows, like tags
+along a screen edge) go through both; the selected quads must be the same.
+
+Usage (from backend/):
+    python -m benchmarks.bench_quad_selection --tags 4 8 12 16 20 --frames 200
+'''
+import argparse
+import time
+from itertools import combinations
+
+import numpy as np
+
+from app.utils.videoConfigFrame import select_largest_quad
+
+
+def calculate_polygon_area(points):
+    '''Calculate the area of a polygon given its vertices.'''
+    x, y = np.array(points).T
+    return 0.5 * np.abs(np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1)))
+
+
+def are_three_points_almost_collinear(pts, tol=1000):
+    '''Check if any three points are almost collinear.'''
+    for i in range(4):
+        for j in range(i + 1, 4):
+            for k in range(j + 1, 4):
+                p1, p2, p3 = pts[i], pts[j], pts[k]
+                area = 0.5 * np.abs(
+                    p1[0] * (p2[1] - p3[1]) +
+                    p2[0] * (p3[1] - p1[1]) +
+                    p3[0] * (p1[1] - p2[1])
+                )
+                if area < tol:
+                    return True
+    return False
+
+
+def select_largest_quad_loop(detected_tags):
+    best_quad = None
+    best_area = 0
+    for quad in combinations(detected_tags, 4):
+        pts = [tag["center"] for tag in quad]
+        area = calculate_polygon_area(pts)
+        if area > best_area and not are_three_points_almost_collinear(np.array(pts)):
+            best_quad = quad
+            best_area = area
+    return best_quad
+
+
+def random_layout(rng, n):
+    # Tags along the edges of a 1920x1080 screen, seen with some jitter
+    edge = rng.integers(0, 4, n)
+    t = rng.uniform(0, 1, n)
+    x = np.where(edge < 2, t * 1920, np.where(edge == 2, 0, 1920)) + rng.normal(0, 3, n)
+    y = np.where(edge == 0, 0, np.where(edge == 1, 1080, t * 1080)) + rng.normal(0, 3, n)
+    return [{"id": i, "center": (int(a), int(b))} for i, (a, b) in enumerate(zip(x, y))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tags", type=int, nargs="+", default=[4, 8, 12, 16, 20])
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for n in args.tags:
+        layouts = [random_layout(rng, n) for _ in range(args.frames)]
+        t0 = time.perf_counter()
+        expected = [select_largest_quad_loop(tags) for tags in layouts]
+        loop = (time.perf_counter() - t0) / args.frames
+        t0 = time.perf_counter()
+        selected = [select_largest_quad(tags) for tags in layouts]
+        batched = (time.perf_counter() - t0) / args.frames
+        assert selected == expected
+        print(f"{n:3d} tags: loop {loop * 1000:8.2f} ms/frame, batched {batched * 1000:6.3f} ms/frame "
+              f"({loop / batched:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+'''Cold-start time of the backend: import app and call create_app() in a fresh interpreter.
+
+Each run is a new process (nothing cached in sys.modules), with
+WARM_UP_IMPORTS off so the background preload doesn't count. Fails when the
+median exceeds the budget or when one of the heavy dependencies was
+imported during startup.
+
+Usage (from backend/):
+    python -m benchmarks.bench_startup --runs 5 --budget 0.5
+'''
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ("cv2", "pupil_apriltags", "pandas", "matplotlib", "tqdm", "numpy")
+
+PROBE = f'''
+import json, sys, time
+t0 = time.perf_counter()
+import app.config
+app.config.WARM_UP_IMPORTS = False
+from app import create_app
+create_app()
+elapsed = time.perf_counter() - t0
+print(json.dumps({{"seconds": elapsed, "heavy": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=0.5, help="seconds")
+    args = parser.parse_args()
+
+    results = []
+    for _ in range(args.runs):
+        out = subprocess.run([sys.executable, "-c", PROBE], capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    median = statistics.median(r["seconds"] for r in results)
+    heavy = sorted({m for r in results for m in r["heavy"]})
+    print(f"create_app cold start: median {median * 1000:.0f} ms over {args.runs} runs (budget {args.budget * 1000:.0f} ms)")
+    if heavy:
+        print(f"heavy modules imported at startup: {', '.join(heavy)}")
+    if median > args.budget or heavy:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+'''Per-frame cost of the tag detection strategies used by TagTracker.
+
+Compares full-frame detection, detection on a downscaled frame and detection
+inside ROIs around the previous quad, and reports how far each homography
+moves the screen corners away from the full-frame one.
+
+Usage (from backend/):
+    python -m benchmarks.bench_tag_detection path/to/video.mp4 path/to/tags.json --frames 200
+    python -m benchmarks.bench_tag_detection video.mp4 tags.json --resize 3840x2160 --scale 0.25
+'''
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+from app.utils.frameSource import FrameSource
+from app.utils.videoConfigFrame import TagTracker, quad_warp_matrix
+
+
+def screen_corners(tag_data):
+    b, w, h = tag_data["boundary"], tag_data["screen_width"], tag_data["screen_height"]
+    return np.float32([[b, b], [b + w, b], [b + w, b + h], [b, b + h]]).reshape(-1, 1, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video")
+    parser.add_argument("tags")
+    parser.add_argument("--start", type=int, default=0)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--resize", help="WIDTHxHEIGHT to resize frames to, e.g. 3840x2160")
+    parser.add_argument("--scale", type=float, default=0.5)
+    parser.add_argument("--roi-margin", type=float, default=1.0)
+    args = parser.parse_args()
+
+    with open(args.tags) as f:
+        tag_data = json.load(f)
+    size = tuple(int(v) for v in args.resize.split("x")) if args.resize else None
+
+    grays = []
+    with FrameSource(args.video) as source:
+        for _, frame in source.frames([(args.start, args.start + args.frames)]):
+            if frame is not None:
+                if size:
+                    frame = cv2.resize(frame, size, interpolation=cv2.INTER_CUBIC)
+                grays.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+    print(f"{len(grays)} frames of {grays[0].shape[1]}x{grays[0].shape[0]}")
+
+    strategies = {
+        "full frame": TagTracker(tag_data),
+        f"scale {args.scale}": TagTracker(tag_data, scale=args.scale),
+        f"roi margin {args.roi_margin}": TagTracker(tag_data, roi_margin=args.roi_margin),
+    }
+    corners = screen_corners(tag_data)
+    reference = None
+    for name, tracker in strategies.items():
+        quads = []
+        t0 = time.perf_counter()
+        for gray in grays:
+            tracker.quad = tracker.detect(gray)
+            quads.append(tracker.quad)
+        elapsed = time.perf_counter() - t0
+
+        # Screen corners mapped back into the image by each homography
+        projected = [cv2.perspectiveTransform(corners, np.linalg.inv(quad_warp_matrix(q))) if q else None
+                     for q in quads]
+        if reference is None:
+            reference = projected
+        errors = [np.linalg.norm(p - r, axis=2).max() for p, r in zip(projected, reference)
+                  if p is not None and r is not None]
+        found = sum(q is not None for q in quads)
+        print(f"{name:>16}: {1000 * elapsed / len(grays):7.2f} ms/frame, quad found {found}/{len(grays)}, "
+              f"max corner shift vs full frame {max(errors, default=0):.2f} px")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+'''JobManager scheduling: workspaces side by side, one workspace in order, shared process workers.
+
+Run from backend/:
+    python -m pytest tests
+'''
+import os
+import threading
+import time
+
+import pytest
+
+from app.jobs import JobManager
+
+TIMEOUT = 10
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = JobManager(tmp_path / "jobs", workers=4)
+    yield manager
+    manager.executor.shutdown(wait=True, cancel_futures=True)
+
+
+def wait_finished(manager, job, timeout=TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while manager.get(job.id)["status"] not in ("done", "failed", "cancelled"):
+        assert time.monotonic() < deadline, f"job {job.kind} still {manager.get(job.id)['status']}"
+        time.sleep(0.01)
+    return manager.get(job.id)
+
+
+def write_outputs(folder, name, barrier=None, progress=None):
+    '''A job writing into its workspace, meeting the job of the other workspace half way.'''
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, "first.txt"), "w") as f:
+        f.write(name)
+    if barrier is not None:
+        # Only returns once both jobs are running at the same time
+        barrier.wait(TIMEOUT)
+    with open(os.path.join(folder, "second.txt"), "w") as f:
+        f.write(name)
+    return sorted(os.listdir(folder))
+
+
+def test_workspaces_run_side_by_side(manager, tmp_path):
+    barrier = threading.Barrier(2)
+    folders = {workspace: tmp_path / "output" / workspace for workspace in ("a" * 32, "b" * 32)}
+    submitted = [manager.submit("write", write_outputs, str(folder), workspace, barrier, workspace=workspace)
+                 for workspace, folder in folders.items()]
+
+    for job in submitted:
+        state = wait_finished(manager, job)
+        assert state["status"] == "done", state["error"]
+        assert state["result"] == ["first.txt", "second.txt"]
+    for workspace, folder in folders.items():
+        for name in ("first.txt", "second.txt"):
+            assert (folder / name).read_text() == workspace
+    assert [job["id"] for job in manager.list(workspace="a" * 32)] == [submitted[0].id]
+
+
+def test_jobs_of_one_workspace_run_in_order(manager):
+    events = []
+
+    def record(name, progress=None):
+        events.append(("start", name))
+        time.sleep(0.05)
+        events.append(("end", name))
+
+    submitted = [manager.submit("record", record, name, workspace="a" * 32) for name in "xyz"]
+    for job in submitted:
+        assert wait_finished(manager, job)["status"] == "done"
+    assert events == [(edge, name) for name in "xyz" for edge in ("start", "end")]
+
+
+def test_cancelled_queued_job_lets_the_next_one_run(manager):
+    release = threading.Event()
+    workspace = "a" * 32
+    first = manager.submit("wait", lambda progress=None: release.wait(TIMEOUT), workspace=workspace)
+    second = manager.submit("noop", lambda progress=None: None, workspace=workspace)
+    third = manager.submit("noop", lambda progress=None: "ran", workspace=workspace)
+    assert manager.get(second.id)["status"] == "queued"
+    assert manager.cancel(second.id)
+    release.set()
+
+    assert wait_finished(manager, first)["status"] == "done"
+    assert wait_finished(manager, second)["status"] == "cancelled"
+    assert wait_finished(manager, third)["result"] == "ran"
+
+
+def test_process_workers_are_divided_among_running_jobs(manager):
+    release = threading.Event()
+    started = threading.Barrier(3)
+
+    def hold(workers, progress=None):
+        started.wait(TIMEOUT)
+        release.wait(TIMEOUT)
+        return workers
+
+    first = manager.submit("hold", hold, workspace="a" * 32, worker_kwargs=("workers",), workers=8)
+    # The first job is running before the second one starts
+    deadline = time.monotonic() + TIMEOUT
+    while manager.get(first.id)["status"] != "running":
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    second = manager.submit("hold", hold, workspace="b" * 32, worker_kwargs=("workers",), workers=8)
+    started.wait(TIMEOUT)
+    release.set()
+
+    assert wait_finished(manager, first)["result"] == 8
+    assert wait_finished(manager, second)["result"] == 4
+    alone = manager.submit("hold", lambda workers, progress=None: workers, workspace="c" * 32,
+                           worker_kwargs=("workers",), workers=3)
+    assert wait_finished(manager, alone)["result"] == 3
+
+
+def test_wait_returns_at_once_for_jobs_no_longer_in_memory(tmp_path):
+    manager = JobManager(tmp_path / "jobs", max_jobs=1)
+    first = manager.submit("noop", lambda progress=None: "first")
+    assert wait_finished(manager, first)["status"] == "done"
+    second = manager.submit("noop", lambda progress=None: "second")
+    assert wait_finished(manager, second)["status"] == "done"
+    manager.executor.shutdown(wait=True)
+
+    # A later server process only has the state file of the newest job
+    restarted = JobManager(tmp_path / "jobs", max_jobs=1)
+    started = time.monotonic()
+    state, version = restarted.wait(second.id, timeout=TIMEOUT)
+    assert (state["status"], state["result"], version) == ("done", "second", None)
+    # The first one was pruned: no state and no version, not a timeout
+    assert restarted.wait(first.id, timeout=TIMEOUT) == (None, None)
+    assert time.monotonic() - started < TIMEOUT
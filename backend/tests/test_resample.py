@@ -0,0 +1,101 @@
+'''find_closest_indices and NearestTickResampler against the original per-tick loop.
+
+The loop (kept in benchmarks/bench_resample.py) is what gaze2npy used to run
+on the rows of one participant sorted by timestamp: for every interval*i the
+earliest of the closest rows. Ties between rows with the same timestamp go
+to the row that comes first in the file.
+
+Run from backend/:
+    python -m pytest tests
+'''
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.utils.extractRawGaze import NearestTickResampler, find_closest_indices
+from benchmarks.bench_resample import find_closest_indices_loop
+
+INTERVALS = [40, 33.36666666666667, 1000 / 60, 12.5]
+
+
+def eye_tracker_timestamps(rng, rows, start=0.0):
+    '''~120 Hz timestamps with jitter, runs of duplicates and gaps.'''
+    steps = rng.choice([0.0, 0.0, 8.0, 8.0, 8.0, 8.5, 9.0, 41.0], size=rows)
+    return start + np.cumsum(steps)
+
+
+def expected_points(timestamps, points, interval):
+    '''Points the original loop selects, for rows in file order.'''
+    order = np.argsort(timestamps, kind="stable")
+    indices = find_closest_indices_loop(pd.Series(timestamps[order]), interval)
+    return points[order][indices]
+
+
+def resample(timestamps, points, interval, chunk_rows, chunk_order=None):
+    resampler = NearestTickResampler(interval)
+    bounds = list(range(0, len(timestamps), chunk_rows))
+    if chunk_order is not None:
+        bounds = [bounds[i] for i in chunk_order(len(bounds))]
+    for start in bounds:
+        end = start + chunk_rows
+        resampler.update(timestamps[start:end], points[start:end], np.arange(start, min(end, len(timestamps))))
+    return resampler.result()
+
+
+@pytest.mark.parametrize("interval", INTERVALS)
+@pytest.mark.parametrize("start", [0.0, 3.0, 1234.5])
+def test_find_closest_indices_matches_loop(interval, start):
+    rng = np.random.default_rng(0)
+    timestamps = pd.Series(eye_tracker_timestamps(rng, 3000, start))
+    assert list(find_closest_indices(timestamps, interval)) == list(find_closest_indices_loop(timestamps, interval))
+
+
+@pytest.mark.parametrize("interval", INTERVALS)
+def test_find_closest_indices_ties_take_earliest(interval):
+    # Every timestamp repeated, and targets exactly half way between two samples
+    timestamps = pd.Series(np.repeat(np.arange(0, 2000, interval / 2), 3))
+    assert list(find_closest_indices(timestamps, interval)) == list(find_closest_indices_loop(timestamps, interval))
+
+
+@pytest.mark.parametrize("interval", INTERVALS)
+@pytest.mark.parametrize("chunk_rows", [1, 7, 256, 5000])
+def test_resampler_matches_loop(interval, chunk_rows):
+    rng = np.random.default_rng(1)
+    timestamps = eye_tracker_timestamps(rng, 3000, start=17.0)
+    points = rng.uniform(0, 1920, size=(len(timestamps), 2))
+    result = resample(timestamps, points, interval, chunk_rows)
+    np.testing.assert_array_equal(result, expected_points(timestamps, points, interval))
+
+
+@pytest.mark.parametrize("interval", INTERVALS)
+@pytest.mark.parametrize("chunk_rows", [5, 64])
+def test_resampler_chunk_order_does_not_matter(interval, chunk_rows):
+    rng = np.random.default_rng(2)
+    timestamps = eye_tracker_timestamps(rng, 2000)
+    points = rng.uniform(0, 1080, size=(len(timestamps), 2))
+    expected = expected_points(timestamps, points, interval)
+    for chunk_order in (lambda n: range(n - 1, -1, -1), lambda n: rng.permutation(n)):
+        np.testing.assert_array_equal(resample(timestamps, points, interval, chunk_rows, chunk_order), expected)
+
+
+@pytest.mark.parametrize("interval", INTERVALS)
+def test_resampler_duplicates_across_chunk_boundaries(interval):
+    # Runs of equal timestamps split over chunks, each row with its own point
+    timestamps = np.repeat(np.arange(0, 1500, 7.0), 4)
+    points = np.stack([np.arange(len(timestamps)), -np.arange(len(timestamps))], axis=1).astype(float)
+    for chunk_rows in (1, 2, 3, 5):
+        result = resample(timestamps, points, interval, chunk_rows)
+        np.testing.assert_array_equal(result, expected_points(timestamps, points, interval))
+
+
+def test_resampler_unsorted_rows_and_nan_timestamps():
+    rng = np.random.default_rng(3)
+    timestamps = eye_tracker_timestamps(rng, 1500)
+    points = rng.uniform(0, 1920, size=(len(timestamps), 2))
+    # Rows out of order inside the file, with rows without a timestamp mixed in
+    shuffle = rng.permutation(len(timestamps))
+    file_timestamps = np.insert(timestamps[shuffle], [10, 500, 900], np.nan)
+    file_points = np.insert(points[shuffle], [10, 500, 900], -1.0, axis=0)
+    # The original sorted by timestamp, rows with the same one stay in file order
+    expected = expected_points(timestamps[shuffle], points[shuffle], 40)
+    np.testing.assert_array_equal(resample(file_timestamps, file_points, 40, 100), expected)
@@ -31,7 +31,7 @@ const ExtractRawGaze = () => {
     <div>
       <h2>Extract Raw Gaze</h2>
       <div style={{ margin: "10px 0" }}>
-        <input type="file" accept=".xlsx,.xls" onChange={handleFileChange} />
+        <input type="file" accept=".xlsx,.xls,.csv,.tsv" onChange={handleFileChange} />
       </div>
       <input
         type="text"
@@ -1,4 +1,6 @@
 import React, { useEffect, useState } from "react";
+import { describeProgress, waitForJob } from "../jobs";
+import { uploadFile } from "../uploads";
 
 const RESULT_FILES = [
   { name: "video.mp4", label: "Video Result", type: "video" },
@@ -81,9 +83,11 @@ export function Gazeprocess() {
     const fileInfo = RESULT_FILES[idx];
     const file = customFiles[fileInfo.name];
     if (!file) return alert("请选择文件");
-    const formData = new FormData();
-    formData.append("file", file);
     try {
+      // 视频等大文件分块上传，中断后可续传
+      const upload = await uploadFile(file);
+      const formData = new FormData();
+      formData.append("upload_id", upload.upload_id);
       const res = await fetch(`/api/upload_user_result/${idx}`, {
         method: "POST",
         body: formData
@@ -110,10 +114,10 @@ export function Gazeprocess() {
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ output_folder: outputFolder })
       });
-      const data = await res.json();
+      const data = await waitForJob(res, (job) => setSubmitMsg(describeProgress(job)));
       setSubmitMsg(data.message || "Upload successful");
-    } catch {
-      setSubmitMsg("Upload failed");
+    } catch (err) {
+      setSubmitMsg("Upload failed: " + err.message);
     }
   };
 
@@ -1,4 +1,6 @@
 import React, { useState } from "react";
+import { describeProgress, waitForJob } from "../jobs";
+import { uploadFile } from "../uploads";
 
 const VideoSegmentation = () => {
   const [videoFile, setVideoFile] = useState(null);
@@ -11,6 +13,7 @@ const VideoSegmentation = () => {
   const [mediaCondition, setMediaCondition] = useState("");
   const [serverResponse, setServerResponse] = useState("");
   const [plotUrl, setPlotUrl] = useState("");
+  const [progressMsg, setProgressMsg] = useState("");
 
   const handleFileChange = (e) => {
     const file = e.target.files[0];
@@ -25,8 +28,17 @@ const VideoSegmentation = () => {
   };
 
   const handleFetchSegments = async () => {
+    let upload;
+    try {
+      upload = await uploadFile(videoFile, (done, total) =>
+        setProgressMsg(`Uploading video: ${Math.round((100 * done) / total)}%`));
+    } catch (err) {
+      setProgressMsg("Upload failed: " + err.message);
+      return;
+    }
+
     const formData = new FormData();
-    formData.append("video", videoFile);
+    formData.append("upload_id", upload.upload_id);
     formData.append("light", lightCondition);
     formData.append("head", headCondition);
     formData.append("media", mediaCondition);
@@ -36,7 +48,14 @@ const VideoSegmentation = () => {
       body: formData,
     });
 
-    const data = await response.json();
+    let data;
+    try {
+      data = await waitForJob(response, (job) => setProgressMsg(describeProgress(job)));
+      setProgressMsg("");
+    } catch (err) {
+      setProgressMsg("Detection failed: " + err.message);
+      return;
+    }
     setStarts(data.starts || []);
     setEnds(data.ends || []);
     setLabels(data.labels || []);
@@ -91,7 +110,14 @@ const VideoSegmentation = () => {
       body: JSON.stringify(payload)
     });
 
-    const data = await response.json();
+    let data;
+    try {
+      data = await waitForJob(response, (job) => setProgressMsg(describeProgress(job)));
+      setProgressMsg("");
+    } catch (err) {
+      setProgressMsg("Gaze processing failed: " + err.message);
+      return;
+    }
     setServerResponse(data.message);
     // 通知 Gazeprocess 检查 segments_25fps.json
     window.dispatchEvent(new Event("segments_25fps_uploaded"));
@@ -125,6 +151,7 @@ const VideoSegmentation = () => {
       </div>
 
       <button onClick={handleFetchSegments} disabled={!videoFile} style={{ margin: "12px 0" }}>Detect Segments</button>
+      {progressMsg && <p style={{ color: "#0984e3" }}>{progressMsg}</p>}
 
       {plotUrl && (
         <div style={{ margin: "18px 0" }}>
@@ -0,0 +1,76 @@
+// 后端长时间任务（detect_segments / submit_segments / submit_final_results）返回 job_id，
+// 这里通过 /api/jobs/<job_id>/events (Server-Sent Events) 跟踪任务直到结束，
+// 浏览器不支持或连接断开时退回轮询 /api/jobs/<job_id>
+
+const formatSeconds = (seconds) => {
+  const s = Math.round(seconds);
+  return s >= 60 ? `${Math.floor(s / 60)}m ${s % 60}s` : `${s}s`;
+};
+
+export const describeProgress = (job) => {
+  const p = job.progress || {};
+  const rate = p.frames_per_second ? `, ${p.frames_per_second} fps` : "";
+  const eta = p.eta_seconds !== undefined ? `, ETA ${formatSeconds(p.eta_seconds)}` : "";
+  if (p.segment) {
+    return `Processing ${p.segment}: ${p.segment_done}/${p.segment_total} frames (${p.frames_done}/${p.frames_total} total${rate}${eta})`;
+  }
+  if (p.frames_total) {
+    return `Processing: ${p.frames_done}/${p.frames_total} frames${rate}${eta}`;
+  }
+  return job.status === "queued" ? "Queued..." : "Processing...";
+};
+
+const finishedJob = (job) => {
+  if (job.status === "done") {
+    return job.result;
+  }
+  throw new Error(job.error || `Job ${job.status}`);
+};
+
+const pollJob = async (jobId, onProgress, interval) => {
+  for (;;) {
+    const res = await fetch(`/api/jobs/${jobId}`);
+    const job = await res.json();
+    if (!res.ok) {
+      throw new Error(job.error || `Job lookup failed (${res.status})`);
+    }
+    if (["done", "failed", "cancelled"].includes(job.status)) {
+      return finishedJob(job);
+    }
+    if (onProgress) onProgress(job);
+    await new Promise((resolve) => setTimeout(resolve, interval));
+  }
+};
+
+const streamJob = (jobId, onProgress, interval) => new Promise((resolve, reject) => {
+  const source = new EventSource(`/api/jobs/${jobId}/events`);
+  source.addEventListener("progress", (e) => {
+    if (onProgress) onProgress(JSON.parse(e.data));
+  });
+  ["done", "failed", "cancelled"].forEach((status) => {
+    source.addEventListener(status, (e) => {
+      source.close();
+      try {
+        resolve(finishedJob(JSON.parse(e.data)));
+      } catch (err) {
+        reject(err);
+      }
+    });
+  });
+  source.onerror = () => {
+    source.close();
+    pollJob(jobId, onProgress, interval).then(resolve, reject);
+  };
+});
+
+// Resolves with the job result, rejects when the job failed or was cancelled
+export const waitForJob = async (response, onProgress, interval = 1000) => {
+  const accepted = await response.json();
+  if (!response.ok) {
+    throw new Error(accepted.error || `Request failed (${response.status})`);
+  }
+  if (typeof EventSource === "undefined") {
+    return pollJob(accepted.job_id, onProgress, interval);
+  }
+  return streamJob(accepted.job_id, onProgress, interval);
+};
@@ -0,0 +1,50 @@
+// 大文件（场景视频）分块上传到 /api/uploads，连接中断后从服务器记录的 offset 继续，
+// 不需要重新上传整个文件。完成后把 upload_id 交给 detect_segments / upload_user_result。
+
+const CHUNK_SIZE = 8 * 1024 * 1024;
+const MAX_RETRIES = 5;
+
+const currentOffset = async (uploadId) => {
+  const res = await fetch(`/api/uploads/${uploadId}`);
+  const state = await res.json();
+  if (!res.ok) throw new Error(state.error || `Upload lookup failed (${res.status})`);
+  return state.offset;
+};
+
+// Resolves with the final upload state ({upload_id, size, sha256, ...})
+export const uploadFile = async (file, onProgress) => {
+  const res = await fetch("/api/uploads", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ filename: file.name, size: file.size })
+  });
+  let state = await res.json();
+  if (!res.ok) throw new Error(state.error || `Upload failed (${res.status})`);
+
+  let offset = 0;
+  let retries = 0;
+  while (state.sha256 === null) {
+    try {
+      const chunkRes = await fetch(`/api/uploads/${state.upload_id}`, {
+        method: "PATCH",
+        headers: {
+          "Content-Type": "application/offset+octet-stream",
+          "Upload-Offset": String(offset)
+        },
+        body: file.slice(offset, offset + CHUNK_SIZE)
+      });
+      const data = await chunkRes.json();
+      if (!chunkRes.ok) throw new Error(data.error || `Upload failed (${chunkRes.status})`);
+      state = data;
+      offset = state.offset;
+      retries = 0;
+      if (onProgress) onProgress(offset, file.size);
+    } catch (err) {
+      if (++retries > MAX_RETRIES) throw err;
+      // Dropped connection: continue from what the server has actually stored
+      await new Promise((resolve) => setTimeout(resolve, 1000 * retries));
+      offset = await currentOffset(state.upload_id);
+    }
+  }
+  return state;
+};